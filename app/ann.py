@@ -0,0 +1,255 @@
+"""Retrieve aproximado (mode=approximate) con MinHash-LSH sobre los síntomas de cada caso.
+
+Cada caso se resume en ANN_BANDS x ANN_ROWS minhashes de su conjunto de
+síntomas; dos conjuntos comparten una banda con probabilidad ~ J^ANN_ROWS
+(J = Jaccard), así que los casos parecidos a la consulta caen en sus mismos
+buckets. Se juntan los candidatos de todas las bandas, se quedan los
+ANN_MAX_CANDIDATES con más bandas en común y se re-puntúan con cbr.compare:
+los scores devueltos son exactos, lo aproximado es el conjunto de candidatos.
+
+Más bandas o menos filas por banda suben el recall y el número de candidatos;
+ANN_MAX_CANDIDATES acota el coste del re-scoring. Con menos de ANN_MIN_CASES
+casos se usa el kernel exacto. `python -m bench.recall` mide recall@k y
+latencia contra el retrieve exacto.
+
+La cobertura premia a los casos pequeños contenidos en la consulta, que
+tienen Jaccard bajo con ella: para no perderlos conviene ANN_ROWS=2.
+
+Los buckets de cada banda son arrays ordenados (searchsorted); los casos que
+llegan por retain van a un buffer en dicts que se funde con los arrays cada
+ANN_MERGE_EVERY altas. Las bajas se marcan y se purgan en la siguiente fusión.
+"""
+import heapq
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from .casebase import CaseRecord, Snapshot
+
+ANN_BANDS = int(os.getenv("ANN_BANDS", "32"))
+ANN_ROWS = int(os.getenv("ANN_ROWS", "3"))
+ANN_MAX_CANDIDATES = int(os.getenv("ANN_MAX_CANDIDATES", "500"))
+ANN_MERGE_EVERY = int(os.getenv("ANN_MERGE_EVERY", "10000"))
+# por debajo de este tamaño el kernel exacto ya es más rápido que reunir candidatos
+ANN_MIN_CASES = int(os.getenv("ANN_MIN_CASES", "50000"))
+# construir el índice en el arranque (app/startup.py) si el case base llega a ANN_MIN_CASES
+ANN_PREBUILD = os.getenv("ANN_PREBUILD", "true").lower() in ("1", "true", "yes")
+
+log = logging.getLogger("psych_cbr.ann")
+
+_PRIME = (1 << 31) - 1
+# elementos (permutaciones x síntomas) por bloque al firmar en lote
+_BLOCK_ELEMS = 8_000_000
+
+
+def _code_hash(code: str) -> int:
+    return zlib.crc32(code.encode()) % _PRIME
+
+
+class LSHIndex:
+    """Índice MinHash-LSH con la interfaz reset/add/discard de CaseBase.attach()."""
+
+    def __init__(self, bands: int = ANN_BANDS, rows: int = ANN_ROWS, seed: int = 1):
+        self.bands, self.rows = bands, rows
+        rng = np.random.default_rng(seed)
+        n = bands * rows
+        self._a = rng.integers(1, _PRIME, size=n, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=n, dtype=np.int64)
+        self._mix = rng.integers(1, 1 << 62, size=rows, dtype=np.uint64) | np.uint64(1)
+        self._lock = threading.Lock()
+        self._records: Dict[int, CaseRecord] = {}
+        self._keys: List[np.ndarray] = [np.empty(0, dtype=np.uint64) for _ in range(bands)]
+        self._ids: List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(bands)]
+        self._pending: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._pending_n = 0
+        self._removed: Set[int] = set()
+
+    # --- firmas --------------------------------------------------------------
+
+    def _band_keys(self, sig: np.ndarray) -> np.ndarray:
+        """(n, bands*rows) minhashes -> (n, bands) claves uint64 de bucket."""
+        sig = sig.astype(np.uint64).reshape(sig.shape[0], self.bands, self.rows)
+        with np.errstate(over="ignore"):
+            return (sig * self._mix).sum(axis=2, dtype=np.uint64)
+
+    def signatures(self, indptr: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        """Minhashes por fila de un CSR de hashes de síntoma, en bloques acotados."""
+        n = indptr.shape[0] - 1
+        out = np.full((n, self._a.shape[0]), _PRIME, dtype=np.int64)
+        counts = np.diff(indptr)
+        nz = np.flatnonzero(counts)
+        if nz.size == 0:
+            return out
+        step = max(1, _BLOCK_ELEMS // (self._a.shape[0] * max(1, int(counts.max()))))
+        for start in range(0, nz.size, step):
+            rows = nz[start:start + step]
+            lo, hi = int(indptr[rows[0]]), int(indptr[rows[-1] + 1])
+            vals = (self._a[:, None] * hashes[None, lo:hi] + self._b[:, None]) % _PRIME
+            out[rows] = np.minimum.reduceat(vals, indptr[rows] - lo, axis=1).T
+        return out
+
+    def _record_keys(self, records: List[CaseRecord]) -> np.ndarray:
+        indptr = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(r.weights) for r in records], out=indptr[1:])
+        hashes = np.fromiter((_code_hash(c) for r in records for c in r.weights), dtype=np.int64, count=int(indptr[-1]))
+        return self._band_keys(self.signatures(indptr, hashes))
+
+    def query_keys(self, codes: Iterable[str]) -> Optional[np.ndarray]:
+        hashes = np.fromiter((_code_hash(c) for c in codes), dtype=np.int64)
+        if hashes.size == 0:
+            return None
+        return self._band_keys(self.signatures(np.array([0, hashes.size]), hashes))[0]
+
+    # --- altas y bajas -----------------------------------------------------------
+
+    def reset(self, records: Iterable[CaseRecord]) -> None:
+        records = list(records)
+        keys = self._record_keys(records) if records else np.empty((0, self.bands), dtype=np.uint64)
+        ids = np.fromiter((r.id for r in records), dtype=np.int64, count=len(records))
+        with self._lock:
+            self._records = {r.id: r for r in records}
+            for band in range(self.bands):
+                order = np.argsort(keys[:, band], kind="stable")
+                self._keys[band] = keys[order, band]
+                self._ids[band] = ids[order]
+            self._pending = [{} for _ in range(self.bands)]
+            self._pending_n = 0
+            self._removed = set()
+
+    def add(self, record: CaseRecord) -> None:
+        keys = self._record_keys([record])[0]
+        with self._lock:
+            self._removed.discard(record.id)
+            self._records[record.id] = record
+            for band, key in enumerate(keys.tolist()):
+                self._pending[band].setdefault(key, []).append(record.id)
+            self._pending_n += 1
+            if self._pending_n >= ANN_MERGE_EVERY:
+                self._merge()
+
+    def discard(self, case_id: int) -> None:
+        with self._lock:
+            if self._records.pop(case_id, None) is not None:
+                self._removed.add(case_id)
+
+    def _merge(self) -> None:
+        """Funde el buffer en los arrays ordenados y purga las bajas (con el lock tomado)."""
+        removed = np.fromiter(self._removed, dtype=np.int64, count=len(self._removed))
+        for band in range(self.bands):
+            pend = self._pending[band]
+            keys = np.fromiter((k for k, ids in pend.items() for _ in ids), dtype=np.uint64)
+            ids = np.fromiter((i for v in pend.values() for i in v), dtype=np.int64)
+            keys = np.concatenate([self._keys[band], keys])
+            ids = np.concatenate([self._ids[band], ids])
+            if removed.size:
+                alive = ~np.isin(ids, removed)
+                keys, ids = keys[alive], ids[alive]
+            order = np.argsort(keys, kind="stable")
+            self._keys[band], self._ids[band] = keys[order], ids[order]
+        self._pending = [{} for _ in range(self.bands)]
+        self._pending_n = 0
+        self._removed = set()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # --- consulta ----------------------------------------------------------------
+
+    def candidates(self, codes: Iterable[str], max_candidates: int = ANN_MAX_CANDIDATES) -> List[CaseRecord]:
+        """Casos que comparten algún bucket con la consulta, los de más bandas en común primero."""
+        qkeys = self.query_keys(codes)
+        if qkeys is None:
+            return []
+        with self._lock:
+            parts = []
+            for band, key in enumerate(qkeys.tolist()):
+                keys = self._keys[band]
+                lo = np.searchsorted(keys, np.uint64(key), side="left")
+                hi = np.searchsorted(keys, np.uint64(key), side="right")
+                if hi > lo:
+                    parts.append(self._ids[band][lo:hi])
+                extra = self._pending[band].get(key)
+                if extra:
+                    parts.append(np.asarray(extra, dtype=np.int64))
+            if not parts:
+                return []
+            ids, hits = np.unique(np.concatenate(parts), return_counts=True)
+            if ids.size > max_candidates:
+                # más bandas en común = mayor Jaccard estimado; empates por id
+                keep = np.lexsort((ids, -hits))[:max_candidates]
+                ids = ids[keep]
+            return [self._records[i] for i in ids.tolist() if i in self._records]
+
+    def retrieve(self, snap: Snapshot, weights: Dict[str, float], top_k: int,
+                 max_candidates: int = ANN_MAX_CANDIDATES, min_cases: int = ANN_MIN_CASES):
+        """Top-k aproximado con scores exactos; sin candidatos suficientes, el kernel exacto de matrix."""
+        from . import matrix
+        from .cbr import compare
+
+        if len(snap) < min_cases:
+            return matrix.retrieve(matrix.for_snapshot(snap), weights, top_k)
+        # score de cobertura sin los detalles: misma suma, en el mismo orden, que compare()
+        codes = sorted(weights)
+        scored = []
+        for c in self.candidates(weights, max_candidates):
+            sw = c.weights
+            similarity = sum(sw[s] for s in codes if s in sw) / c.total_weight
+            if similarity > 0:
+                scored.append((-similarity, c.id, c))
+        if len(scored) < top_k:
+            return matrix.retrieve(matrix.for_snapshot(snap), weights, top_k)
+        winners = heapq.nsmallest(top_k, scored)
+        return [(c, -neg, compare(c, weights)[1]) for neg, _, c in winners]
+
+
+lsh = LSHIndex()
+# serializa construcciones; las consultas no lo toman (usan index_or_build)
+_lsh_lock = threading.Lock()
+_lsh_attached = False
+_builder: Optional[threading.Thread] = None
+_builder_lock = threading.Lock()
+
+
+def ensure_attached() -> LSHIndex:
+    """Construye el índice (si no lo está) y lo engancha a las altas/bajas del case base.
+
+    Las firmas se calculan sobre un snapshot sin el lock del case base: los
+    retains siguen entrando y al enganchar solo se le pasa la diferencia.
+    """
+    global _lsh_attached
+    if not _lsh_attached:
+        from .casebase import case_base
+
+        with _lsh_lock:
+            if not _lsh_attached:
+                snap = case_base.snapshot()
+                lsh.reset(snap.records)
+                case_base.attach(lsh, built_from=snap)
+                _lsh_attached = True
+    return lsh
+
+
+def _build() -> None:
+    global _builder
+    try:
+        ensure_attached()
+    except Exception:
+        log.exception("LSH index build failed")
+    finally:
+        _builder = None
+
+
+def index_or_build() -> Optional[LSHIndex]:
+    """El índice si ya está listo; si no, lanza su construcción en un hilo y devuelve None (el llamador usa el exacto)."""
+    global _builder
+    if _lsh_attached:
+        return lsh
+    with _builder_lock:
+        if _builder is None and not _lsh_attached:
+            _builder = threading.Thread(target=_build, name="ann-build", daemon=True)
+            _builder.start()
+    return lsh if _lsh_attached else None
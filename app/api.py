@@ -1,138 +1,502 @@
-from fastapi import APIRouter, Depends, Request, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, Body, Depends, Query, Request, Response, HTTPException, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .db import SessionLocal
-from . import models, cbr
-from .schemas import DiagnoseRequest, DiagnoseResponse, RetainRequest
+from .db import AsyncReadSessionLocal, get_db, get_read_db, mark_write, read_sessionmaker
+from . import audit, importer, models, cbr, startup, subscriptions
+from .executor import Overloaded, RETRIEVE_RETRY_AFTER, SnapshotUnavailable, executor
+from .telemetry import span
+from .cache import result_cache
+from .casebase import CaseRecord, case_base
+from .refdata import Body as CachedBody, etag_matches, refdata
+from .schemas import (
+    CaseUpdate, CompactRequest, DiagnoseBatchResponse, DiagnoseRequest, DiagnoseResponse, RetainRequest,
+    SubscribeRequest,
+)
 
 router = APIRouter()
 
+# máximo de consultas por POST /v1/diagnose/batch
+DIAGNOSE_BATCH_MAX = int(os.getenv("DIAGNOSE_BATCH_MAX", "1000"))
+# tamaño de página máximo de GET /v1/cases
+CASES_PAGE_MAX = int(os.getenv("CASES_PAGE_MAX", "1000"))
+# filas por lote del cursor de servidor en GET /v1/consults
+CONSULTS_STREAM_BATCH = int(os.getenv("CONSULTS_STREAM_BATCH", "1000"))
+
+
+async def _ensure_refdata(db: AsyncSession) -> None:
+    # con la caché vigente no se toca la DB (la sesión ni siquiera pide conexión)
+    if not refdata.fresh:
+        await db.run_sync(refdata.load)
+
+
+def _cached(request: Request, body: CachedBody) -> Response:
+    headers = {"ETag": body.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), body.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body.content, media_type="application/json", headers=headers)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.get("/v1/symptom-categories")
-async def list_symptom_categories(db: Session = Depends(get_db)):
-    rows = db.execute(select(models.SymptomCategory)).scalars().all()
-    return [{"code": r.code, "name": r.name} for r in rows]
+async def list_symptom_categories(request: Request, db: AsyncSession = Depends(get_read_db)):
+    await _ensure_refdata(db)
+    return _cached(request, refdata.body("symptom-categories"))
 
 
 @router.get("/v1/symptoms")
-async def list_symptoms(q: str | None = None, db: Session = Depends(get_db)):
-    stmt = select(models.Symptom)
+async def list_symptoms(request: Request, q: str | None = None, db: AsyncSession = Depends(get_read_db)):
+    await _ensure_refdata(db)
     if q:
-        like = f"%{q}%"
-        stmt = stmt.where(models.Symptom.name.like(like))
-    rows = db.execute(stmt.order_by(models.Symptom.code)).scalars().all()
-    return [{"code": r.code, "name": r.name, "category_code": r.category_code} for r in rows]
+        return _cached(request, refdata.search_symptoms(q))
+    return _cached(request, refdata.body("symptoms"))
 
 
 @router.get("/v1/diseases")
-async def list_diseases(db: Session = Depends(get_db)):
-    rows = db.execute(select(models.Disease).order_by(models.Disease.code)).scalars().all()
-    return [{"code": r.code, "name": r.name} for r in rows]
+async def list_diseases(request: Request, db: AsyncSession = Depends(get_read_db)):
+    await _ensure_refdata(db)
+    return _cached(request, refdata.body("diseases"))
 
 
 @router.get("/v1/solutions")
-async def list_solutions(db: Session = Depends(get_db)):
-    rows = db.execute(select(models.Solution).order_by(models.Solution.code)).scalars().all()
-    return [{"code": r.code, "name": r.name} for r in rows]
+async def list_solutions(request: Request, db: AsyncSession = Depends(get_read_db)):
+    await _ensure_refdata(db)
+    return _cached(request, refdata.body("solutions"))
+
+
+async def _case_rows(db: AsyncSession, stmt) -> List[dict]:
+    """Casos como dicts a partir de tuplas: 3 consultas en total, sin identidades ORM."""
+    out = [
+        {"id": cid, "disease_code": dcode, "notes": notes, "symptom_weights": {}, "solutions": []}
+        for cid, dcode, notes in (await db.execute(stmt)).all()
+    ]
+    if not out:
+        return out
+    by_id = {c["id"]: c for c in out}
+    weights = await db.execute(
+        select(models.CaseSymptomWeight.case_id, models.CaseSymptomWeight.symptom_code, models.CaseSymptomWeight.weight)
+        .where(models.CaseSymptomWeight.case_id.in_(by_id))
+    )
+    for cid, code, w in weights.all():
+        by_id[cid]["symptom_weights"][code] = float(w)
+    solutions = await db.execute(
+        select(models.CaseSolution.case_id, models.CaseSolution.solution_code)
+        .where(models.CaseSolution.case_id.in_(by_id))
+        .order_by(models.CaseSolution.case_id, models.CaseSolution.solution_code)
+    )
+    for cid, code in solutions.all():
+        by_id[cid]["solutions"].append(code)
+    return out
 
 
 @router.get("/v1/cases")
-async def list_cases(disease_code: str | None = None, db: Session = Depends(get_db)):
-    stmt = select(models.Case).where(models.Case.is_active == True)
+async def list_cases(
+    response: Response,
+    disease_code: str | None = None,
+    after_id: Optional[int] = Query(None, description="id del último caso de la página anterior"),
+    limit: int = Query(100, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Casos activos del más nuevo al más antiguo, paginados por keyset sobre el id.
+
+    La página siguiente se pide con `after_id` = último id recibido (cabecera
+    `X-Next-After-Id` cuando puede haber más); cuesta lo mismo en cualquier página.
+    """
+    limit = min(limit, CASES_PAGE_MAX)
+    stmt = select(models.Case.id, models.Case.disease_code, models.Case.notes).where(models.Case.is_active == True)
     if disease_code:
         stmt = stmt.where(models.Case.disease_code == disease_code)
-    rows = db.execute(stmt.order_by(models.Case.id.desc()).limit(100)).scalars().all()
-    out = []
-    for c in rows:
-        out.append({
-        "id": c.id,
-        "disease_code": c.disease_code,
-        "notes": c.notes,
-        "symptom_weights": {w.symptom_code: float(w.weight) for w in c.symptom_weights},
-        "solutions": [s.solution_code for s in c.solutions],
-        })
-    return out
+    if after_id is not None:
+        stmt = stmt.where(models.Case.id < after_id)
+    rows = await _case_rows(db, stmt.order_by(models.Case.id.desc()).limit(limit))
+    if len(rows) == limit:
+        response.headers["X-Next-After-Id"] = str(rows[-1]["id"])
+    return rows
 
 
 @router.post("/v1/cases", status_code=201)
-async def retain_case(payload: RetainRequest, db: Session = Depends(get_db)):
-    disease = db.get(models.Disease, payload.disease_code)
-    if not disease:
-        raise HTTPException(422, detail="Unknown disease_code")
+async def retain_case(payload: RetainRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    # validación contra los códigos en caché (sin releer symptoms/solutions)
+    with span("validate"):
+        await _ensure_refdata(db)
+        error = importer.validate_case(payload)
+    if error:
+        raise HTTPException(422, detail=error)
 
+    with span("insert"):
+        c = models.Case(disease_code=payload.disease_code, notes=payload.notes)
+        db.add(c); await db.flush()
+        for k, w in payload.symptom_weights.items():
+            db.add(models.CaseSymptomWeight(case_id=c.id, symptom_code=k, weight=float(w)))
+        for s in payload.solutions:
+            db.add(models.CaseSolution(case_id=c.id, solution_code=s))
+    with span("commit"):
+        await db.commit()
+    with span("case_base"):
+        disease_name = refdata.disease_names[payload.disease_code]
+        case_base.add(CaseRecord(c.id, payload.disease_code, disease_name, payload.symptom_weights, sorted(set(payload.solutions))))
+    mark_write(response)
+    return {"id": c.id}
 
-    sym_rows = db.execute(select(models.Symptom.code)).all()
-    sym_codes = {row[0] for row in sym_rows}
-    for k in payload.symptom_weights.keys():
-        if k not in sym_codes:
-            raise HTTPException(422, detail=f"Unknown symptom_code: {k}")
 
+@router.post("/v1/cases/bulk")
+async def retain_cases_bulk(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """NDJSON en streaming: un caso por línea; inserción por bloques y reporte de errores por línea."""
+    await _ensure_refdata(db)
+    await _snapshot(db)
+    job = importer.BulkImport()
+    line_no = 0
+    async for line in importer.aiter_lines(request.stream()):
+        line_no += 1
+        for n, raw in importer.parse_jsonl([line], start=line_no):
+            if job.feed(n, raw):
+                await db.run_sync(job.flush)
+    await db.run_sync(job.flush)
+    if job.imported:
+        mark_write(response)
+    return job.report()
 
-    sol_rows = db.execute(select(models.Solution.code)).all()
-    sol_codes = {row[0] for row in sol_rows}
-    for s in payload.solutions:
-        if s not in sol_codes:
-            raise HTTPException(422, detail=f"Unknown solution_code: {s}")
+@router.patch("/v1/cases/{case_id}")
+async def update_case(case_id: int, payload: CaseUpdate, response: Response, db: AsyncSession = Depends(get_db)):
+    c = await db.get(models.Case, case_id)
+    if not c:
+        raise HTTPException(404, detail="Case not found")
+    c.is_active = payload.is_active
+    await db.commit()
+    await db.run_sync(case_base.reload_case, case_id)
+    mark_write(response)
+    return {"id": c.id, "is_active": c.is_active}
 
+@router.post("/v1/maintenance/compact")
+async def compact_cases(payload: CompactRequest, response: Response):
+    """Detecta casos redundantes y, con apply, los desactiva (ver app/maintenance.py).
 
-    c = models.Case(disease_code=payload.disease_code, notes=payload.notes)
-    db.add(c); db.flush()
-    for k, w in payload.symptom_weights.items():
-        db.add(models.CaseSymptomWeight(case_id=c.id, symptom_code=k, weight=float(w)))
-    for s in payload.solutions:
-        db.add(models.CaseSolution(case_id=c.id, solution_code=s))
-    db.commit()
-    return {"id": c.id}
+    Trabajo de CPU y sesión síncrona propia: se ejecuta en un hilo aparte.
+    """
+    from . import maintenance  # trae NumPy; fuera del arranque
 
-@router.post("/v1/diagnose", response_model=DiagnoseResponse)
-async def diagnose(req: DiagnoseRequest, request: Request, db: Session = Depends(get_db)):
+    threshold = payload.threshold if payload.threshold is not None else maintenance.MAINTENANCE_THRESHOLD
+    report = await asyncio.to_thread(maintenance.compact, threshold, payload.apply)
+    if report["applied"] and report["redundant"]:
+        mark_write(response)
+    return report
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    # created_at se guarda sin zona (DATETIME); las fechas con zona se pasan a UTC
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+async def _consult_lines(stmt, sessionmaker) -> AsyncIterator[bytes]:
+    """Una línea JSON por consulta con sus resultados, leyendo con cursor de servidor.
+
+    Abre su propia sesión: la de Depends se cierra antes de que empiece el streaming.
+    """
+    async with sessionmaker() as db:
+        result = await db.stream(stmt.execution_options(yield_per=CONSULTS_STREAM_BATCH))
+        current: Optional[dict] = None
+        async for row in result:
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    yield (json.dumps(current, ensure_ascii=False) + "\n").encode()
+                current = {
+                    "id": row.id,
+                    "created_at": row.created_at.isoformat(),
+                    "top_k": row.top_k,
+                    "query_weights": row.query_weights,
+                    "client_ip": row.client_ip,
+                    "user_agent": row.user_agent,
+                    "results": [],
+                }
+            if row.rank_pos is not None:
+                current["results"].append({
+                    "rank_pos": row.rank_pos,
+                    "disease_code": row.disease_code,
+                    "similarity": row.similarity,
+                    "matched": (row.matched or {}).get("codes", []),
+                    "missing": (row.missing or {}).get("codes", []),
+                    "solutions": row.solutions,
+                })
+        if current is not None:
+            yield (json.dumps(current, ensure_ascii=False) + "\n").encode()
+
+
+@router.get("/v1/consults")
+async def export_consults(
+    request: Request,
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    after_id: Optional[int] = None,
+):
+    """Historial de auditoría en NDJSON (una consulta por línea), en memoria constante.
+
+    `from`/`to` filtran por created_at ([from, to)); `after_id` reanuda una
+    exportación cortada a partir del último id recibido. Los ids no llegan a la
+    base en orden (cada worker escribe en lotes diferidos), así que la reanudación
+    solo es completa para consultas más antiguas que el retraso del writer: para
+    un histórico exacto, exportar con `to` unos segundos en el pasado.
+    """
+    C, R = models.Consult, models.ConsultResult
+    stmt = (
+        select(
+            C.id, C.created_at, C.top_k, C.query_weights, C.client_ip, C.user_agent,
+            R.rank_pos, R.disease_code, R.similarity, R.matched, R.missing, R.solutions,
+        )
+        .outerjoin(R, R.consult_id == C.id)
+        .order_by(C.id, R.rank_pos)
+    )
+    if since is not None:
+        stmt = stmt.where(C.created_at >= _naive_utc(since))
+    if until is not None:
+        stmt = stmt.where(C.created_at < _naive_utc(until))
+    if after_id is not None:
+        stmt = stmt.where(C.id > after_id)
+    return StreamingResponse(_consult_lines(stmt, read_sessionmaker(request)), media_type="application/x-ndjson")
+
+
+def _query_weights(req: DiagnoseRequest) -> Dict[str, float]:
     if not req.symptoms and not req.weights:
         raise HTTPException(422, detail="Provide symptoms[] or weights{}")
-    weights = req.weights or {s: 1.0 for s in (req.symptoms or [])}
+    return req.weights or {s: 1.0 for s in (req.symptoms or [])}
 
-    # 1) Casos activos
-    cases = db.execute(select(models.Case).where(models.Case.is_active == True)).scalars().all()
 
-    # 2) Retrieve/Reuse
-    retr = cbr.retrieve(cases, weights)
-    props = cbr.reuse(retr, top_k=req.top_k)
+async def _solution_names(db: AsyncSession, proposals: List[dict]) -> Dict[str, str]:
+    """Nombres de las soluciones propuestas desde la caché de refdata.
 
-    # 3) Guarda cabecera de la consulta (sin tocar columna solutions)
-    consult = models.Consult(
-        top_k=req.top_k,
-        query_weights=weights,
-        client_ip=(request.client.host if request.client else None),
-        user_agent=request.headers.get("User-Agent"),
-    )
-    db.add(consult); db.flush()
+    Solo los códigos que aún no están en la caché (soluciones nuevas antes del
+    siguiente refresco) se piden a la DB, todos en una consulta.
+    """
+    codes = {code for p in proposals for code in p["solutions"]}
+    if not codes:
+        return {}
+    await _ensure_refdata(db)
+    known = refdata.solution_names
+    names = {code: known[code] for code in codes if code in known}
+    missing = codes - names.keys()
+    if missing:
+        rows = (await db.execute(
+            select(models.Solution.code, models.Solution.name).where(models.Solution.code.in_(missing))
+        )).all()
+        names.update(rows)
+    return names
+
+
+async def _snapshot(db: AsyncSession):
+    if not case_base.loaded:
+        await startup.wait_warm()
+    if not case_base.loaded:
+        await db.run_sync(case_base.load)
+    return case_base.snapshot()
+
+
+def _consult_row(request: Request, top_k: int, weights: Dict[str, float]) -> dict:
+    return {
+        "id": audit.ids.next_id(),
+        "top_k": top_k,
+        "query_weights": weights,
+        "client_ip": request.client.host if request.client else None,
+        "user_agent": request.headers.get("User-Agent"),
+    }
 
-    # 4) Guarda resultados y arma payload
-    response_payload = []
+
+def _results(consult_id: int, props: List[dict], names: Dict[str, str]):
+    """Filas ConsultResult y payload de respuesta para una consulta."""
+    rows, payload = [], []
     for i, p in enumerate(props, start=1):
-        sol_names = db.execute(
-            select(models.Solution.name).where(models.Solution.code.in_(p["solutions"]))
-        ).scalars().all()
-
-        db.add(models.ConsultResult(
-            consult_id=consult.id,
-            rank_pos=i,
-            disease_code=p["disease_code"],
-            similarity=p["similarity"],
-            matched={"codes": p["matched_symptoms"]},
-            missing={"codes": p["missing_from_query"]},
-            solutions={"codes": p["solutions"], "names": sol_names},
+        sol_names = [names[code] for code in p["solutions"] if code in names]
+        rows.append({
+            "consult_id": consult_id,
+            "rank_pos": i,
+            "disease_code": p["disease_code"],
+            "similarity": p["similarity"],
+            "matched": {"codes": p["matched_symptoms"]},
+            "missing": {"codes": p["missing_from_query"]},
+            "solutions": {"codes": p["solutions"], "names": sol_names},
+        })
+        payload.append({**p, "solutions": sol_names})
+    return rows, payload
+
+
+async def _admitted(retrieval):
+    """Espera un retrieve del executor; sin hueco en su cola o sin case base mapeado, 503 para que el cliente reintente."""
+    try:
+        return await retrieval
+    except Overloaded:
+        raise HTTPException(503, detail="Retrieval queue full", headers={"Retry-After": str(RETRIEVE_RETRY_AFTER)})
+    except SnapshotUnavailable:
+        raise HTTPException(503, detail="Case base snapshot not available",
+                            headers={"Retry-After": str(RETRIEVE_RETRY_AFTER)})
+
+
+@router.post("/v1/diagnose", response_model=DiagnoseResponse)
+async def diagnose(req: DiagnoseRequest, request: Request, db: AsyncSession = Depends(get_read_db)):
+    weights = _query_weights(req)
+
+    # 1) Casos activos (snapshot en memoria, sin tocar la DB)
+    with span("case_load"):
+        snap = await _snapshot(db)
+
+    # 2) Retrieve/Reuse, memoizado por consulta canónica y versión del case base
+    key = result_cache.key(weights, req.top_k, *req.cache_params())
+    props = result_cache.get(key, snap.version)
+    if props is None:
+        with span("retrieve"):
+            version, retr = await _admitted(
+                executor.search(snap, weights, req.retrieve_k(), req.metric, req.mode, **req.metric_params())
+            )
+        with span("reuse"):
+            props = cbr.reuse(retr, top_k=req.top_k, how=req.aggregate)
+        # bajo la versión realmente puntuada (un proceso hijo puede ir por delante de snap)
+        result_cache.put(key, version, props)
+
+    # 3) Cabecera de la consulta con id propio (sin tocar columna solutions)
+    consult = _consult_row(request, req.top_k, weights)
+
+    # 4) Resultados y payload; la escritura la hace el writer de auditoría
+    with span("solution_names"):
+        names = await _solution_names(db, props)
+    rows, response_payload = _results(consult["id"], props, names)
+    with span("audit"):
+        await audit.writer.submit([(consult, rows)])
+    return {"consult_id": consult["id"], "proposals": response_payload}
+
+
+@router.post("/v1/diagnose/batch", response_model=DiagnoseBatchResponse)
+async def diagnose_batch(
+    request: Request,
+    items: List[Any] = Body(...),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if len(items) > DIAGNOSE_BATCH_MAX:
+        raise HTTPException(422, detail=f"At most {DIAGNOSE_BATCH_MAX} queries per batch")
+
+    # 1) Validación por elemento: un error no tumba el lote
+    out: List[dict] = [{} for _ in items]
+    valid: List[tuple] = []
+    for i, raw in enumerate(items):
+        try:
+            req = DiagnoseRequest.model_validate(raw)
+            valid.append((i, req, _query_weights(req)))
+        except ValidationError as e:
+            out[i] = {"error": "; ".join(
+                f"{'.'.join(str(x) for x in err['loc']) or 'item'}: {err['msg']}" for err in e.errors()
+            )}
+        except HTTPException as e:
+            out[i] = {"error": e.detail}
+    if not valid:
+        return {"results": out}
+
+    # 2) Todas contra el mismo snapshot (producto matriz-matriz con CBR_ENGINE=matrix);
+    #    solo se calculan las que no están en la caché de resultados
+    snap = await _snapshot(db)
+    keys = [result_cache.key(w, req.top_k, *req.cache_params()) for _, req, w in valid]
+    all_props = [result_cache.get(key, snap.version) for key in keys]
+    todo = [j for j, props in enumerate(all_props) if props is None]
+    if todo:
+        version, retrs = await _admitted(executor.search_many(
+            snap,
+            [valid[j][2] for j in todo],
+            [valid[j][1].retrieve_k() for j in todo],
+            [(valid[j][1].metric, valid[j][1].metric_params()) for j in todo],
+            [valid[j][1].mode for j in todo],
         ))
+        for j, retr in zip(todo, retrs):
+            all_props[j] = cbr.reuse(retr, top_k=valid[j][1].top_k, how=valid[j][1].aggregate)
+            result_cache.put(keys[j], version, all_props[j])
+
+    # 3) Cabeceras y resultados; el writer los inserta en bloque
+    names = await _solution_names(db, [p for props in all_props for p in props])
+    records = []
+    for (i, req, w), props in zip(valid, all_props):
+        consult = _consult_row(request, req.top_k, w)
+        rows, payload = _results(consult["id"], props, names)
+        records.append((consult, rows))
+        out[i] = {"consult_id": consult["id"], "proposals": payload}
+    await audit.writer.submit(records)
+    return {"results": out}
 
-        response_payload.append({**p, "solutions": sol_names})
 
-    db.commit()
-    return {"consult_id": consult.id, "proposals": response_payload}
+async def _ensure_case_base() -> None:
+    # las suscripciones no usan sesión por request: se abre una solo si hay que cargar
+    if not case_base.loaded:
+        await startup.wait_warm()
+    if not case_base.loaded:
+        async with AsyncReadSessionLocal() as db:
+            await db.run_sync(case_base.load)
+
+
+def _subscription(req: SubscribeRequest) -> subscriptions.Subscription:
+    if len(subscriptions.registry) >= subscriptions.SUBSCRIPTIONS_MAX:
+        raise HTTPException(503, detail="Too many subscriptions")
+    return subscriptions.Subscription(_query_weights(req), req.top_k, asyncio.get_running_loop())
+
+
+@router.websocket("/v1/subscriptions")
+async def subscribe_ws(websocket: WebSocket):
+    """Consulta en vivo por WebSocket: el primer mensaje es el cuerpo (SubscribeRequest).
+
+    Se reciben `snapshot` (ranking completo), `delta` (un caso nuevo entra en el
+    top_k) y `ping`. Mensajes posteriores del cliente se ignoran.
+    """
+    await websocket.accept()
+    try:
+        await _ensure_case_base()
+        sub = _subscription(SubscribeRequest.model_validate(await websocket.receive_json()))
+    except (ValidationError, ValueError) as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    except HTTPException as e:
+        # 1013 = try again later (límite de suscripciones)
+        await websocket.close(code=1013 if e.status_code == 503 else 1008, reason=str(e.detail)[:120])
+        return
+
+    async def pump():
+        async for message in subscriptions.messages(sub):
+            await websocket.send_json(message or {"type": "ping"})
+
+    subscriptions.registry.register(sub)
+    sender = asyncio.create_task(pump())
+    try:
+        # leer hasta el cierre es lo que detecta la desconexión del cliente
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        subscriptions.registry.unregister(sub)
+
+
+async def _sse(sub: subscriptions.Subscription) -> AsyncIterator[bytes]:
+    subscriptions.registry.register(sub)
+    try:
+        async for message in subscriptions.messages(sub):
+            if message is None:
+                yield b": ping\n\n"
+            else:
+                yield f"event: {message['type']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n".encode()
+    finally:
+        # el cliente cerró: StreamingResponse cancela el generador
+        subscriptions.registry.unregister(sub)
+
+
+@router.get("/v1/subscriptions/sse")
+async def subscribe_sse(
+    symptoms: List[str] = Query(..., description="códigos de síntoma (repetible o separados por comas)"),
+    top_k: int = Query(3, ge=1, le=20),
+):
+    """Consulta en vivo por Server-Sent Events (EventSource): mismos mensajes que el WebSocket."""
+    codes = [c for part in symptoms for c in part.split(",") if c]
+    await _ensure_case_base()
+    sub = _subscription(SubscribeRequest(symptoms=codes, top_k=top_k))
+    # X-Accel-Buffering: nginx entrega cada evento sin esperar a llenar su buffer
+    return StreamingResponse(
+        _sse(sub), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
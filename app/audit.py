@@ -0,0 +1,265 @@
+"""Persistencia de consultas (Consult/ConsultResult) fuera del camino de respuesta."""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .db import AsyncSessionLocal, engine
+
+log = logging.getLogger(__name__)
+
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "true").lower() in ("1", "true", "yes")
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_MS = int(os.getenv("AUDIT_FLUSH_MS", "200"))
+AUDIT_RETRIES = 3
+# bits del worker_id en los ids de consulta (máximo de procesos vivos = 2^bits); los 12 bits
+# por debajo del milisegundo se reparten entre worker y secuencia. Igual en todo el despliegue.
+ID_WORKER_BITS = int(os.getenv("ID_WORKER_BITS", "5"))
+# vida del worker_id reservado en worker_leases; se renueva cada tercio (app/main.py)
+WORKER_LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "60"))
+
+
+class IdGenerator:
+    """Ids de consulta generados en el cliente, crecientes y de 53 bits.
+
+    41 bits de milisegundos desde 2024-01-01 y 12 repartidos entre worker
+    (ID_WORKER_BITS, 5 por defecto: 32 procesos) y secuencia (7 por defecto:
+    128 ids por ms y proceso): caben en un entero de JavaScript sin perder precisión.
+
+    El worker_id se reserva en la tabla worker_leases al arrancar: cada proceso
+    vivo (de cualquier host) tiene uno distinto aunque compartan el .env. La
+    reserva caduca a los WORKER_LEASE_SECONDS si el proceso muere sin liberarla.
+    """
+
+    EPOCH_MS = 1704067200000
+
+    def __init__(self, worker_id: Optional[int] = None, worker_bits: int = ID_WORKER_BITS):
+        if not 1 <= worker_bits <= 10:
+            raise ValueError(f"ID_WORKER_BITS must be between 1 and 10, got {worker_bits}")
+        self.worker_bits = worker_bits
+        self.seq_bits = 12 - worker_bits
+        self.worker_id = worker_id
+        self.owner = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._seq = 0
+
+    def reserve(self, bind: Engine = engine) -> int:
+        """Ocupa el primer worker_id libre o caducado; RuntimeError si están todos en uso."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=WORKER_LEASE_SECONDS)
+        lease = models.WorkerLease
+        for slot in range(1 << self.worker_bits):
+            with bind.begin() as conn:
+                # el UPDATE condicional es atómico: de dos procesos a la vez solo uno ve la fila caducada
+                taken = conn.execute(
+                    update(lease).where(lease.worker_id == slot, lease.expires_at < now)
+                    .values(owner=self.owner, expires_at=expires)
+                ).rowcount == 1
+            if not taken:
+                try:
+                    with bind.begin() as conn:
+                        conn.execute(insert(lease).values(worker_id=slot, owner=self.owner, expires_at=expires))
+                except IntegrityError:
+                    continue  # lo tiene otro proceso vivo
+            with self._lock:
+                self.worker_id = slot
+            log.info("audit: worker_id %d reservado (%s)", slot, self.owner)
+            return slot
+        raise RuntimeError(
+            f"no quedan worker_id libres ({1 << self.worker_bits} procesos vivos); sube ID_WORKER_BITS"
+        )
+
+    def renew(self, bind: Engine = engine) -> None:
+        """Alarga la reserva; si otro proceso la tomó (caducó), reserva otro worker_id."""
+        if self.worker_id is None:
+            self.reserve(bind)
+            return
+        lease = models.WorkerLease
+        with bind.begin() as conn:
+            kept = conn.execute(
+                update(lease).where(lease.worker_id == self.worker_id, lease.owner == self.owner)
+                .values(expires_at=datetime.utcnow() + timedelta(seconds=WORKER_LEASE_SECONDS))
+            ).rowcount == 1
+        if not kept:
+            log.warning("audit: se perdió la reserva del worker_id %d", self.worker_id)
+            self.reserve(bind)
+
+    def release(self, bind: Engine = engine) -> None:
+        if self.worker_id is None:
+            return
+        lease = models.WorkerLease
+        with bind.begin() as conn:
+            conn.execute(
+                update(lease).where(lease.worker_id == self.worker_id, lease.owner == self.owner)
+                .values(expires_at=datetime.utcnow())
+            )
+
+    def next_id(self) -> int:
+        if self.worker_id is None:
+            # scripts sin el arranque de app.main
+            self.reserve()
+        with self._lock:
+            now = int(time.time() * 1000) - self.EPOCH_MS
+            if now < self._last_ms:
+                now = self._last_ms  # reloj hacia atrás: seguimos en el último ms
+            if now == self._last_ms:
+                self._seq = (self._seq + 1) % (1 << self.seq_bits)
+                if self._seq == 0:
+                    # secuencia agotada en este ms: pasamos al siguiente
+                    while now <= self._last_ms:
+                        now = int(time.time() * 1000) - self.EPOCH_MS
+            else:
+                self._seq = 0
+            self._last_ms = now
+            return (now << (self.worker_bits + self.seq_bits)) | (self.worker_id << self.seq_bits) | self._seq
+
+
+ids = IdGenerator()
+
+Record = Tuple[dict, List[dict]]  # (fila Consult, filas ConsultResult)
+
+
+async def write_records(records: List[Record]) -> None:
+    """Inserta cabeceras y resultados con un executemany (INSERT multi-fila) por tabla."""
+    consults = [c for c, _ in records]
+    results = [r for _, rs in records for r in rs]
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(models.Consult), consults)
+        if results:
+            await db.execute(insert(models.ConsultResult), results)
+        await db.commit()
+
+
+class AuditWriter:
+    """Cola acotada + tarea que agrupa registros cada AUDIT_FLUSH_MS o AUDIT_BATCH_SIZE."""
+
+    def __init__(self, max_queue: int = AUDIT_QUEUE_MAX, batch_size: int = AUDIT_BATCH_SIZE, flush_ms: int = AUDIT_FLUSH_MS):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Dict[str, float] = {
+            "enqueued": 0, "written": 0, "batches": 0, "failed": 0, "retries": 0,
+            "blocked": 0, "max_depth": 0, "last_batch_size": 0, "last_flush_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Drena la cola y escribe lo pendiente antes de salir."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, records: List[Record]) -> None:
+        if not self.running:
+            # sin writer (scripts, AUDIT_ASYNC=false): escritura en línea
+            await write_records(records)
+            self._counters["written"] += len(records)
+            return
+        for rec in records:
+            if self._queue.full():
+                # backpressure: la petición espera a que el writer libere sitio
+                self._counters["blocked"] += 1
+            await self._queue.put(rec)
+            self._counters["enqueued"] += 1
+        self._counters["max_depth"] = max(self._counters["max_depth"], self._queue.qsize())
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.max_queue,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_ms / 1000
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # drenado final: lo que quede tras el centinela
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for i in range(0, len(rest), self.batch_size):
+            await self._flush(rest[i:i + self.batch_size])
+
+    async def _write_each(self, batch: List[Record]) -> int:
+        """Escribe registro a registro; descarta (y anota) solo los que fallan. Devuelve los escritos."""
+        written = 0
+        for rec in batch:
+            try:
+                await write_records([rec])
+                written += 1
+            except Exception:
+                log.exception("audit: se descarta la consulta %s", rec[0].get("id"))
+                self._counters["failed"] += 1
+        return written
+
+    async def _flush(self, batch: List[Record]) -> None:
+        t0 = time.perf_counter()
+        written = len(batch)
+        for attempt in range(AUDIT_RETRIES):
+            try:
+                await write_records(batch)
+                break
+            except IntegrityError:
+                # reintentar el lote entero fallaría igual: se separa la fila mala del resto
+                log.warning("audit: error de integridad en un lote de %d; se escribe uno a uno", len(batch))
+                written = await self._write_each(batch)
+                break
+            except Exception:
+                if attempt == AUDIT_RETRIES - 1:
+                    log.exception("audit: se descartan %d consultas tras %d intentos", len(batch), AUDIT_RETRIES)
+                    self._counters["failed"] += len(batch)
+                    return
+                self._counters["retries"] += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        self._counters["written"] += written
+        self._counters["batches"] += 1
+        self._counters["last_batch_size"] = len(batch)
+        self._counters["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+
+writer = AuditWriter()
@@ -0,0 +1,82 @@
+"""Memoización de retrieve/reuse para consultas repetidas de /v1/diagnose."""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "4096"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0"))
+
+
+class ResultCache:
+    """LRU acotado con TTL opcional; cada entrada va etiquetada con la versión del case base.
+
+    Una entrada de otra versión cuenta como fallo (y se descarta), así que
+    cualquier retain o desactivación invalida exactamente lo que puede cambiar.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[int, float, List[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    @staticmethod
+    def key(weights: Dict[str, float], top_k: int, *extra: Hashable) -> Hashable:
+        # forma canónica: pesos ordenados por código, como float
+        return (tuple(sorted((k, float(v)) for k, v in weights.items())), top_k, *extra)
+
+    def get(self, key: Hashable, version: int) -> Optional[List[dict]]:
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, stored_at, value = entry
+            if entry_version != version or (self.ttl > 0 and time.monotonic() - stored_at > self.ttl):
+                del self._data[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, version: int, value: List[dict]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (version, time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,268 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# ids por consulta IN al traer los casos que faltan en un refresh
+_REFRESH_CHUNK = 1000
+# margen hacia atrás de cada refresco sobre cases.updated_at: cubre transacciones que
+# se confirman después de marcar la fila (retains lentos, bloques de importación)
+CASEBASE_REFRESH_OVERLAP_SECONDS = float(os.getenv("CASEBASE_REFRESH_OVERLAP_SECONDS", "120"))
+
+
+class CaseRecord:
+    """Caso activo en memoria: solo lo que necesitan retrieve/reuse."""
+
+    __slots__ = ("id", "disease_code", "disease_name", "weights", "total_weight", "solutions")
+
+    def __init__(
+        self,
+        id: int,
+        disease_code: str,
+        disease_name: str,
+        weights: Dict[str, float],
+        solutions: Iterable[str] = (),
+    ):
+        self.id = id
+        self.disease_code = disease_code
+        self.disease_name = disease_name
+        # pesos ordenados por código de síntoma
+        self.weights = {k: float(weights[k]) for k in sorted(weights)}
+        self.total_weight = float(sum(self.weights.values())) or 1.0
+        self.solutions = tuple(solutions)
+
+
+class Snapshot:
+    """Vista inmutable del case base para una versión concreta.
+
+    `matrix` viene ya construida cuando el snapshot sale de un archivo mapeado
+    (app/mapped.py); si no, app/matrix.py la construye bajo demanda.
+    """
+
+    __slots__ = ("version", "records", "matrix")
+
+    def __init__(self, version: int, records: Sequence[CaseRecord], matrix=None):
+        self.version = version
+        self.records = records
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class CaseBase:
+    """Case base de proceso: se carga una vez y se actualiza al retener casos."""
+
+    # el refresco recarga también los casos ya conocidos cuya fila cambió (soluciones fusionadas)
+    _reload_changed = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[int, CaseRecord] = {}
+        self._snapshot: Optional[Snapshot] = None
+        self.version = 0
+        self.loaded = False
+        self._indexes: list = []
+        # reloj de la DB al empezar la última carga/refresco (None = el próximo es completo)
+        self._refreshed_at: Optional[datetime] = None
+        # (id, updated_at) ya vistos dentro de la ventana de solape
+        self._seen: Set[Tuple[int, datetime]] = set()
+
+    def attach(self, index, built_from: Optional[Snapshot] = None) -> None:
+        """Registra un índice derivado (reset/add/discard) y lo puebla con lo actual.
+
+        Con `built_from`, el índice ya se pobló con ese snapshot (fuera del lock):
+        solo se le pasan los casos que entraron, cambiaron o salieron desde entonces.
+        """
+        with self._lock:
+            if built_from is None:
+                index.reset(self._records.values())
+            else:
+                seen = {r.id: r for r in built_from.records}
+                for case_id in seen.keys() - self._records.keys():
+                    index.discard(case_id)
+                for case_id, record in self._records.items():
+                    old = seen.get(case_id)
+                    if old is not record:
+                        if old is not None:
+                            index.discard(case_id)
+                        index.add(record)
+            self._indexes.append(index)
+
+    def load(self, db: Session) -> None:
+        started = _db_now(db)
+        records = _load_records(db)
+        self._refreshed_at, self._seen = started, set()
+        with self._lock:
+            self._records = {r.id: r for r in records}
+            self.version += 1
+            self._snapshot = None
+            self.loaded = True
+            for ix in self._indexes:
+                ix.reset(self._records.values())
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.load(db)
+
+    def refresh(self, db: Session) -> int:
+        """Aplica los cambios de otros procesos; devuelve los casos traídos.
+
+        Solo lee las filas de `cases` con updated_at desde el refresco anterior
+        menos CASEBASE_REFRESH_OVERLAP_SECONDS, así que el coste sigue a lo que
+        cambió y no al tamaño de la tabla. El solape recoge lo que se confirma
+        fuera de orden (un retain lento en otro worker, un bloque de importación);
+        lo ya visto en la ventana anterior no se vuelve a cargar. Sin refresco
+        previo (p. ej. un archivo mapeado reutilizado) se revisa la tabla entera.
+        Solo se quitan los casos que la DB da como inactivos, así un retain local
+        que la réplica aún no tiene no se pierde.
+        """
+        started = _db_now(db)
+        stmt = select(models.Case.id, models.Case.is_active, models.Case.updated_at)
+        full = self._refreshed_at is None
+        if not full:
+            since = self._refreshed_at - timedelta(seconds=CASEBASE_REFRESH_OVERLAP_SECONDS)
+            stmt = stmt.where(models.Case.updated_at >= since)
+        rows = db.execute(stmt).all()
+        known = self._known_ids([case_id for case_id, _, _ in rows])
+        gone = known.intersection(case_id for case_id, is_active, _ in rows if not is_active)
+        if gone:
+            self.discard_many(gone)
+        # activos que faltan, o ya conocidos pero modificados: fila no vista en la ventana anterior
+        # (confirmada tarde) o marcada desde el refresco anterior (updated_at va en segundos)
+        missing = sorted(
+            case_id for case_id, is_active, updated_at in rows
+            if is_active and (case_id not in known or (
+                self._reload_changed and not full
+                and ((case_id, updated_at) not in self._seen or updated_at >= self._refreshed_at)))
+        )
+        self._refreshed_at = started
+        self._seen = set() if full else {(case_id, updated_at) for case_id, _, updated_at in rows}
+        records: List[CaseRecord] = []
+        for i in range(0, len(missing), _REFRESH_CHUNK):
+            records.extend(_load_records(db, ids=missing[i:i + _REFRESH_CHUNK]))
+        if records:
+            self.add_many(records)
+        return len(records)
+
+    def _known_ids(self, ids: Sequence[int]) -> Set[int]:
+        """Los de `ids` que están en el case base."""
+        with self._lock:
+            return {case_id for case_id in ids if case_id in self._records}
+
+    def reload_case(self, db: Session, case_id: int) -> None:
+        """Sincroniza un caso tras cambiar is_active: lo añade si está activo, si no lo quita."""
+        records = _load_records(db, ids=[case_id])
+        if records:
+            self.add(records[0])
+        else:
+            self.discard(case_id)
+
+    def add(self, record: CaseRecord) -> None:
+        self.add_many([record])
+
+    def add_many(self, records: Iterable[CaseRecord]) -> None:
+        """Añade (o reemplaza) casos con un único salto de versión."""
+        with self._lock:
+            for record in records:
+                if record.id in self._records:
+                    for ix in self._indexes:
+                        ix.discard(record.id)
+                self._records[record.id] = record
+                for ix in self._indexes:
+                    ix.add(record)
+            self.version += 1
+            self._snapshot = None
+
+    def discard(self, case_id: int) -> None:
+        self.discard_many([case_id])
+
+    def discard_many(self, case_ids: Iterable[int]) -> None:
+        """Quita casos (desactivados) con un único salto de versión."""
+        with self._lock:
+            removed = False
+            for case_id in case_ids:
+                if self._records.pop(case_id, None) is not None:
+                    removed = True
+                    for ix in self._indexes:
+                        ix.discard(case_id)
+            if removed:
+                self.version += 1
+                self._snapshot = None
+
+    def snapshot(self) -> Snapshot:
+        snap = self._snapshot
+        if snap is not None:
+            return snap
+        with self._lock:
+            if self._snapshot is None:
+                records = tuple(self._records[k] for k in sorted(self._records))
+                self._snapshot = Snapshot(self.version, records)
+            return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+def _db_now(db: Session) -> datetime:
+    # reloj de la DB, el mismo que escribe updated_at (sin desfase con el del worker)
+    return db.execute(select(func.now())).scalar()
+
+
+def _load_records(db: Session, ids: Optional[Sequence[int]] = None) -> List[CaseRecord]:
+    # 3 consultas con proyección de columnas en lugar de N+1 lazy-loads
+    filters = [models.Case.is_active == True]
+    if ids is not None:
+        filters.append(models.Case.id.in_(ids))
+    case_rows = db.execute(
+        select(models.Case.id, models.Case.disease_code, models.Disease.name)
+        .outerjoin(models.Disease, models.Disease.code == models.Case.disease_code)
+        .where(*filters)
+        .order_by(models.Case.id)
+    ).all()
+    if not case_rows:
+        return []
+
+    weights: Dict[int, Dict[str, float]] = {row[0]: {} for row in case_rows}
+    w_rows = db.execute(
+        select(
+            models.CaseSymptomWeight.case_id,
+            models.CaseSymptomWeight.symptom_code,
+            models.CaseSymptomWeight.weight,
+        )
+        .join(models.Case, models.Case.id == models.CaseSymptomWeight.case_id)
+        .where(*filters)
+    ).all()
+    for case_id, code, w in w_rows:
+        weights[case_id][code] = float(w)
+
+    solutions: Dict[int, List[str]] = {row[0]: [] for row in case_rows}
+    s_rows = db.execute(
+        select(models.CaseSolution.case_id, models.CaseSolution.solution_code)
+        .join(models.Case, models.Case.id == models.CaseSolution.case_id)
+        .where(*filters)
+        .order_by(models.CaseSolution.case_id, models.CaseSolution.solution_code)
+    ).all()
+    for case_id, code in s_rows:
+        solutions[case_id].append(code)
+
+    return [
+        CaseRecord(case_id, disease_code, disease_name or disease_code, weights[case_id], solutions[case_id])
+        for case_id, disease_code, disease_name in case_rows
+    ]
+
+
+# con CASEBASE_SNAPSHOT_PATH los workers comparten el case base en un archivo mapeado
+CASEBASE_SNAPSHOT_PATH = os.getenv("CASEBASE_SNAPSHOT_PATH", "")
+
+if CASEBASE_SNAPSHOT_PATH:
+    from .mapped import MappedCaseBase
+
+    case_base: CaseBase = MappedCaseBase(CASEBASE_SNAPSHOT_PATH)
+else:
+    case_base = CaseBase()
@@ -1,44 +1,294 @@
-from typing import Dict, Iterable, List, Tuple
-from .models import Case
+import heapq
+import os
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+from . import similarity
+from .casebase import CaseRecord, Snapshot, case_base
 
 
 # sim = peso_intersección / peso_total_del_caso
 
+# "python" (bucle por caso), "matrix" (CSR + NumPy, ver app/matrix.py)
+# o "index" (listas invertidas síntoma -> casos, ver InvertedIndex)
+ENGINE = os.getenv("CBR_ENGINE", "python").lower()
 
-def _case_total_weight(case: Case) -> float:
-    return float(sum(float(w.weight) for w in case.symptom_weights)) or 1.0
+# holgura para comparar sumas de cocientes con el umbral (redondeo de floats)
+_EPS = 1e-9
 
 
-def retrieve(cases: List[Case], query_symptoms: Iterable[str] | Dict[str, float]):
-    weights = {s: 1.0 for s in query_symptoms} if not isinstance(query_symptoms, dict) else {k: float(v) for k, v in query_symptoms.items()}
-    results: List[Tuple[Case, float, dict]] = []
+def _query_weights(query_symptoms: Iterable[str] | Dict[str, float]) -> Dict[str, float]:
+    if isinstance(query_symptoms, dict):
+        return {k: float(v) for k, v in query_symptoms.items()}
+    return {s: 1.0 for s in query_symptoms}
+
+
+def compare(c: CaseRecord, weights: Dict[str, float]) -> Tuple[float, dict]:
+    sw = c.weights
+    matched = sorted(set(weights).intersection(sw))
+    match_weight = sum(sw[s] for s in matched)
+    total_weight = c.total_weight
+    similarity = match_weight / total_weight
+    details = {
+    "matched": matched,
+    "missing_from_query": sorted(set(sw).difference(weights)),
+    "extra_in_query": sorted(set(weights).difference(sw)),
+    "match_weight": match_weight,
+    "case_total_weight": total_weight,
+    }
+    return similarity, details
+
+
+def retrieve(cases: Sequence[CaseRecord], query_symptoms: Iterable[str] | Dict[str, float]):
+    weights = _query_weights(query_symptoms)
+    results: List[Tuple[CaseRecord, float, dict]] = []
     for c in cases:
-        sw = {cw.symptom_code: float(cw.weight) for cw in c.symptom_weights}
-        matched = sorted(set(weights).intersection(sw))
-        match_weight = sum(sw[s] for s in matched)
-        total_weight = _case_total_weight(c)
-        similarity = match_weight / total_weight
-        details = {
-        "matched": matched,
-        "missing_from_query": sorted(set(sw).difference(weights)),
-        "extra_in_query": sorted(set(weights).difference(sw)),
-        "match_weight": match_weight,
-        "case_total_weight": total_weight,
-        }
+        similarity, details = compare(c, weights)
         results.append((c, similarity, details))
     results.sort(key=lambda t: t[1], reverse=True)
     return results
 
 
-def reuse(retrievals: List[Tuple[Case, float, dict]], top_k: int = 3):
+class InvertedIndex:
+    """Listas invertidas síntoma -> {case_id: peso/peso_total} con poda max-score.
+
+    Un caso sin síntomas en común con la consulta tiene similitud 0, así que solo
+    se recorren las listas de los síntomas consultados. Se procesan de mayor a
+    menor cota (peso/total máximo de la lista); cuando la suma de cotas restantes
+    ya no alcanza al k-ésimo acumulado, ningún caso nuevo puede entrar al top_k y
+    se deja de recorrer. Los candidatos se re-puntúan con compare(), así que el
+    resultado es idéntico a retrieve().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[int, CaseRecord] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # cota superior por lista; al quitar casos no se recalcula (sigue siendo válida)
+        self._max_ratio: Dict[str, float] = {}
+        self._negative = 0
+
+    def reset(self, records: Iterable[CaseRecord]) -> None:
+        with self._lock:
+            self._records = {}
+            self._postings = {}
+            self._max_ratio = {}
+            self._negative = 0
+        for r in records:
+            self.add(r)
+
+    def add(self, record: CaseRecord) -> None:
+        with self._lock:
+            self._records[record.id] = record
+            for code, w in record.weights.items():
+                ratio = w / record.total_weight
+                self._postings.setdefault(code, {})[record.id] = ratio
+                # también con peso 0: retrieve() lee la cota de cada lista no vacía
+                self._max_ratio[code] = max(ratio, self._max_ratio.get(code, 0.0))
+                if w < 0:
+                    self._negative += 1
+
+    def discard(self, case_id: int) -> None:
+        with self._lock:
+            record = self._records.pop(case_id, None)
+            if record is None:
+                return
+            for code, w in record.weights.items():
+                self._postings.get(code, {}).pop(case_id, None)
+                if w < 0:
+                    self._negative -= 1
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def retrieve(self, snap: Snapshot, weights: Dict[str, float], top_k: int):
+        if self._negative:
+            # con pesos negativos las cotas max-score no son válidas
+            return retrieve(snap.records, weights)[:top_k]
+
+        with self._lock:
+            terms = sorted(
+                (code for code in weights if self._postings.get(code)),
+                key=lambda code: self._max_ratio.get(code, 0.0),
+                reverse=True,
+            )
+            remaining = sum(self._max_ratio[code] for code in terms)
+            acc: Dict[int, float] = {}
+            for code in terms:
+                if len(acc) >= top_k:
+                    threshold = heapq.nlargest(top_k, acc.values())[-1]
+                    if remaining + _EPS < threshold:
+                        # solo pueden ganar los ya acumulados con cota >= umbral
+                        acc = {cid: s for cid, s in acc.items() if s + remaining + _EPS >= threshold}
+                        break
+                for cid, ratio in self._postings[code].items():
+                    acc[cid] = acc.get(cid, 0.0) + ratio
+                remaining -= self._max_ratio[code]
+            candidates = [self._records[cid] for cid in acc]
+
+        scored = []
+        for c in candidates:
+            similarity, details = compare(c, weights)
+            if similarity > 0:
+                scored.append((c, similarity, details))
+        results = heapq.nsmallest(top_k, scored, key=lambda t: (-t[1], t[0].id))
+        if len(results) < top_k:
+            # relleno con casos de similitud 0 en orden de id, como el sort estable
+            seen = {c.id for c, _, _ in results}
+            for c in snap.records:
+                if len(results) >= top_k:
+                    break
+                if c.id not in seen:
+                    similarity, details = compare(c, weights)
+                    if similarity <= 0:
+                        results.append((c, similarity, details))
+        return results
+
+
+index = InvertedIndex()
+_index_lock = threading.Lock()
+_index_attached = False
+
+
+def _ensure_index() -> InvertedIndex:
+    global _index_attached
+    if not _index_attached:
+        with _index_lock:
+            if not _index_attached:
+                case_base.attach(index)
+                _index_attached = True
+    return index
+
+
+def search(
+    snap: Snapshot,
+    query_symptoms: Iterable[str] | Dict[str, float],
+    top_k: int,
+    metric: str = similarity.DEFAULT_METRIC,
+    mode: str = "exact",
+    **params,
+):
+    """Top-k del snapshot con el motor configurado en CBR_ENGINE.
+
+    Las métricas distintas de la original van siempre por el kernel vectorizado
+    de app/matrix.py (ver app/similarity.py). mode="approximate" usa los
+    candidatos de MinHash-LSH (app/ann.py), solo con la métrica original y un
+    snapshot en memoria; con uno mapeado (sin índice LSH) o mientras el índice
+    se construye se ejecuta el exacto.
+    """
+    if mode == "approximate" and metric == similarity.DEFAULT_METRIC and snap.matrix is None:
+        from . import ann
+        # mientras el índice se construye en segundo plano, el exacto
+        index = ann.index_or_build()
+        if index is not None:
+            return index.retrieve(snap, _query_weights(query_symptoms), top_k)
+    # un snapshot mapeado (app/mapped.py) ya trae su matriz y no tiene índice propio
+    if ENGINE == "matrix" or metric != similarity.DEFAULT_METRIC or snap.matrix is not None:
+        from . import matrix
+        return matrix.retrieve(matrix.for_snapshot(snap), _query_weights(query_symptoms), top_k, metric, **params)
+    if ENGINE == "index":
+        return _ensure_index().retrieve(snap, _query_weights(query_symptoms), top_k)
+    return top(snap.records, query_symptoms, top_k)
+
+
+def top(cases: Sequence[CaseRecord], query_symptoms: Iterable[str] | Dict[str, float], k: int):
+    """Como retrieve(cases, q)[:k] en una pasada con un heap de tamaño k (empates por posición)."""
+    weights = _query_weights(query_symptoms)
+    scored = ((-sim, i, c, det) for i, c in enumerate(cases) for sim, det in (compare(c, weights),))
+    return [(c, -neg, det) for neg, _, c, det in heapq.nsmallest(k, scored, key=lambda t: (t[0], t[1]))]
+
+
+def search_many(
+    snap: Snapshot,
+    queries: List[Dict[str, float]],
+    top_ks: List[int],
+    metrics: List[Tuple[str, dict]] | None = None,
+    modes: List[str] | None = None,
+):
+    """Como search() para un lote de consultas contra el mismo snapshot.
+
+    Con CBR_ENGINE=matrix las consultas exactas con la métrica original se
+    puntúan juntas con un producto matriz-matriz; el resto, una a una.
+    """
+    metrics = metrics or [(similarity.DEFAULT_METRIC, {})] * len(queries)
+    modes = modes or ["exact"] * len(queries)
+    out: List[list] = [[] for _ in queries]
+    todo = list(range(len(queries)))
+    if ENGINE == "matrix" or snap.matrix is not None:
+        from . import matrix
+        batch = [j for j in todo if metrics[j][0] == similarity.DEFAULT_METRIC and modes[j] == "exact"]
+        in_batch = set(batch)
+        todo = [j for j in todo if j not in in_batch]
+        results = matrix.retrieve_many(
+            matrix.for_snapshot(snap), [_query_weights(queries[j]) for j in batch], [top_ks[j] for j in batch]
+        )
+        for j, res in zip(batch, results):
+            out[j] = res
+    for j in todo:
+        metric, params = metrics[j]
+        out[j] = search(snap, queries[j], top_ks[j], metric, modes[j], **params)
+    return out
+
+
+AGGREGATES = ("max", "mean", "vote")
+
+
+def aggregate(retrievals: List[Tuple[CaseRecord, float, dict]], top_k: int = 3, how: str = "max"):
+    """Una propuesta por enfermedad a partir de los vecinos recuperados (ya ordenados).
+
+    max: mejor similitud del grupo; mean: media del grupo; vote: suma de
+    similitudes del grupo sobre la de todos los vecinos. Los detalles son los del
+    mejor vecino de cada enfermedad y las soluciones se fusionan por frecuencia
+    entre sus vecinos. Una pasada sobre los vecinos y un heap de tamaño top_k.
+    """
+    groups: Dict[str, list] = {}
+    total = 0.0
+    for rank, (case, sim, det) in enumerate(retrievals):
+        sim = float(sim)
+        total += sim
+        g = groups.get(case.disease_code)
+        if g is None:
+            # [primer rango, mejor caso, detalles, n, suma, máx, frecuencias de soluciones]
+            g = groups[case.disease_code] = [rank, case, det, 0, 0.0, sim, {}]
+        g[3] += 1
+        g[4] += sim
+        for code in case.solutions:
+            g[6][code] = g[6].get(code, 0) + 1
+
+    def score(g: list) -> float:
+        if how == "mean":
+            return g[4] / g[3]
+        if how == "vote":
+            return g[4] / total if total > 0 else 0.0
+        return g[5]
+
+    best = heapq.nsmallest(top_k, groups.values(), key=lambda g: (-score(g), g[0]))
+    proposals = []
+    for g in best:
+        _, case, det, n, _, _, freq = g
+        proposals.append({
+        "disease_code": case.disease_code,
+        "disease_name": case.disease_name,
+        "similarity": round(score(g), 3),
+        "matched_symptoms": det["matched"],
+        "missing_from_query": det["missing_from_query"],
+        "solutions": sorted(freq, key=lambda code: (-freq[code], code)),
+        "support": n,
+        })
+    return proposals
+
+
+def reuse(retrievals: List[Tuple[CaseRecord, float, dict]], top_k: int = 3, how: str | None = None):
+    """Propuestas de los top_k casos, o agregadas por enfermedad con how=max|mean|vote."""
+    if how:
+        return aggregate(retrievals, top_k, how)
     proposals = []
     for case, sim, det in retrievals[:top_k]:
         proposals.append({
         "disease_code": case.disease_code,
-        "disease_name": case.disease.name if case.disease else case.disease_code,
+        "disease_name": case.disease_name,
         "similarity": round(float(sim), 3),
         "matched_symptoms": det["matched"],
         "missing_from_query": det["missing_from_query"],
-        "solutions": [s.solution_code for s in case.solutions],
+        "solutions": list(case.solutions),
         })
-    return proposals
\ No newline at end of file
+    return proposals
@@ -0,0 +1,161 @@
+"""Dónde se ejecuta el retrieve de /v1/diagnose y /v1/diagnose/batch, con control de admisión.
+
+RETRIEVE_EXECUTOR:
+
+- inline (por defecto): en el event loop, como siempre. Mientras puntúa, el
+  worker no atiende nada más.
+- thread: en un ThreadPoolExecutor de RETRIEVE_WORKERS hilos. Solo escala con
+  CBR_ENGINE=matrix (NumPy suelta el GIL); el motor python sigue en un core.
+- process: en un ProcessPoolExecutor de RETRIEVE_WORKERS procesos. Cada hijo
+  mapea el archivo de CASEBASE_SNAPSHOT_PATH (app/mapped.py) al arrancar y lo
+  resincroniza por generación, así que todos ven el mismo case base sin
+  copiarlo por tarea. Sin CASEBASE_SNAPSHOT_PATH se usa thread.
+
+Admisión: cada worker admite como mucho RETRIEVE_QUEUE_MAX retrieves en curso
+o en cola; el siguiente recibe 503 con Retry-After en lugar de esperar detrás
+de los demás. Los aciertos de la caché de resultados no pasan por aquí.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from . import cbr
+from .casebase import CASEBASE_SNAPSHOT_PATH, Snapshot
+
+RETRIEVE_EXECUTOR = os.getenv("RETRIEVE_EXECUTOR", "inline").lower()
+RETRIEVE_WORKERS = int(os.getenv("RETRIEVE_WORKERS", "0")) or (os.cpu_count() or 1)
+# retrieves en curso + en cola por worker de uvicorn antes de responder 503
+RETRIEVE_QUEUE_MAX = int(os.getenv("RETRIEVE_QUEUE_MAX", "0")) or 4 * RETRIEVE_WORKERS
+RETRIEVE_RETRY_AFTER = int(os.getenv("RETRIEVE_RETRY_AFTER", "1"))
+
+log = logging.getLogger("psych_cbr.executor")
+
+
+class Overloaded(Exception):
+    """No hay hueco en la cola de retrieve: el handler responde 503."""
+
+
+class SnapshotUnavailable(Exception):
+    """El proceso hijo no tiene archivo de case base que mapear: el handler responde 503."""
+
+
+# --- lado del proceso hijo -------------------------------------------------------
+
+def _child_init() -> None:
+    # el hijo importa app.casebase con el mismo entorno: case_base es un MappedCaseBase
+    from .casebase import case_base
+
+    case_base.snapshot()
+
+
+def _child_init_probe(_: int) -> int:
+    return os.getpid()
+
+
+def _child_snapshot(min_version: int) -> Snapshot:
+    """Snapshot del hijo con al menos la generación que vio el worker de uvicorn."""
+    from .casebase import case_base
+
+    snap = case_base.snapshot_at_least(min_version)
+    if snap is None:
+        raise SnapshotUnavailable(f"{CASEBASE_SNAPSHOT_PATH}: no hay case base publicado")
+    return snap
+
+
+def _child_search(args: tuple):
+    min_version, weights, top_k, metric, mode, params = args
+    snap = _child_snapshot(min_version)
+    return snap.version, cbr.search(snap, weights, top_k, metric, mode, **params)
+
+
+def _child_search_many(args: tuple):
+    min_version, *rest = args
+    snap = _child_snapshot(min_version)
+    return snap.version, cbr.search_many(snap, *rest)
+
+
+# --- lado del worker de uvicorn ------------------------------------------------------
+
+class RetrieveExecutor:
+    def __init__(self, kind: str = RETRIEVE_EXECUTOR, workers: int = RETRIEVE_WORKERS,
+                 queue_max: int = RETRIEVE_QUEUE_MAX):
+        if kind == "process" and not CASEBASE_SNAPSHOT_PATH:
+            log.warning("RETRIEVE_EXECUTOR=process necesita CASEBASE_SNAPSHOT_PATH; se usa thread")
+            kind = "thread"
+        if kind not in ("inline", "thread", "process"):
+            raise ValueError(f"Unknown RETRIEVE_EXECUTOR: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_max = queue_max
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.kind == "process":
+                        import multiprocessing
+
+                        # spawn: el worker ya tiene hilos y event loop, fork no es seguro
+                        self._pool = ProcessPoolExecutor(
+                            self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_child_init,
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="retrieve")
+        return self._pool
+
+    def start(self) -> None:
+        """Arranca el pool (los hijos mapean el case base); llamar con el case base ya cargado."""
+        if self.kind == "process":
+            pool = self._executor()
+            # fuerza el arranque de todos los hijos ahora y no con la primera consulta
+            list(pool.map(_child_init_probe, range(self.workers)))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.queue_max:
+            self.rejected += 1
+            raise Overloaded()
+        self.in_flight += 1
+        try:
+            if self.kind == "inline":
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def search(self, snap: Snapshot, weights: Dict[str, float], top_k: int,
+                     metric: str, mode: str, **params):
+        """(versión del case base puntuado, resultado); con process puede ser más nueva que snap."""
+        if self.kind == "process":
+            return await self._run(_child_search, (snap.version, weights, top_k, metric, mode, params))
+        return snap.version, await self._run(partial(cbr.search, snap, weights, top_k, metric, mode, **params))
+
+    async def search_many(self, snap: Snapshot, queries: List[Dict[str, float]], top_ks: List[int],
+                          metrics: List[Tuple[str, dict]], modes: List[str]):
+        if self.kind == "process":
+            return await self._run(_child_search_many, (snap.version, queries, top_ks, metrics, modes))
+        return snap.version, await self._run(cbr.search_many, snap, queries, top_ks, metrics, modes)
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers if self.kind != "inline" else 0,
+            "queue_max": self.queue_max,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+executor = RetrieveExecutor()
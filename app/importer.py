@@ -0,0 +1,206 @@
+"""Importación masiva de casos (retain) desde CSV o JSONL, en streaming y por bloques.
+
+    python -m app.importer casos.jsonl
+    python -m app.importer casos.csv --chunk-size 2000
+
+JSONL: una línea por caso con los campos de POST /v1/cases.
+CSV: columnas disease_code, symptom_weights ("G01:3;G05:1"), solutions ("T01;T03"), notes.
+
+La memoria no depende del tamaño del archivo: se valida contra los conjuntos de
+códigos en caché (app/refdata.py) y se inserta cada bloque con un executemany por tabla.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .casebase import CaseRecord, case_base
+from .db import SessionLocal
+from .refdata import refdata
+from .schemas import RetainRequest
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# errores por fila que se detallan en el reporte (el resto solo se cuenta)
+IMPORT_MAX_ERRORS = 100
+
+Row = Tuple[int, object]  # (número de línea, dict o mensaje de error de parseo)
+
+
+def validate_case(payload: RetainRequest) -> Optional[str]:
+    """Mismos mensajes que POST /v1/cases, contra los códigos en caché."""
+    if payload.disease_code not in refdata.disease_names:
+        return "Unknown disease_code"
+    for k in payload.symptom_weights:
+        if k not in refdata.symptom_codes:
+            return f"Unknown symptom_code: {k}"
+    for s in payload.solutions:
+        if s not in refdata.solution_names:
+            return f"Unknown solution_code: {s}"
+    return None
+
+
+def parse_jsonl(lines: Iterable[str], start: int = 1) -> Iterator[Row]:
+    for line_no, line in enumerate(lines, start=start):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, f"invalid JSON: {e.msg}"
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Row]:
+    reader = csv.DictReader(lines)
+    for row in reader:
+        line_no = reader.line_num
+        try:
+            weights = {}
+            for part in filter(None, (p.strip() for p in (row.get("symptom_weights") or "").split(";"))):
+                code, _, w = part.partition(":")
+                weights[code.strip()] = float(w) if w else 1.0
+            yield line_no, {
+                "disease_code": (row.get("disease_code") or "").strip(),
+                "symptom_weights": weights,
+                "solutions": [s.strip() for s in (row.get("solutions") or "").split(";") if s.strip()],
+                "notes": row.get("notes") or None,
+            }
+        except ValueError as e:
+            yield line_no, f"invalid row: {e}"
+
+
+class BulkImport:
+    """Acumula casos válidos y los inserta en bloques de chunk_size."""
+
+    def __init__(self, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunk: List[RetainRequest] = []
+        self.imported = 0
+        self.failed = 0
+        self.chunks = 0
+        self.errors: List[dict] = []
+        self._t0 = time.perf_counter()
+
+    def feed(self, line_no: int, raw: object) -> bool:
+        """Valida una fila; devuelve True cuando el bloque está lleno y hay que volcarlo."""
+        if isinstance(raw, str):
+            self._error(line_no, raw)
+            return False
+        try:
+            payload = RetainRequest.model_validate(raw)
+        except ValidationError as e:
+            self._error(line_no, "; ".join(
+                f"{'.'.join(str(x) for x in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+            ))
+            return False
+        error = validate_case(payload)
+        if error:
+            self._error(line_no, error)
+            return False
+        self.chunk.append(payload)
+        return len(self.chunk) >= self.chunk_size
+
+    def flush(self, db: Session) -> None:
+        """Inserta el bloque pendiente (sesión síncrona; desde async vía run_sync)."""
+        if not self.chunk:
+            return
+        records = insert_chunk(db, self.chunk)
+        if case_base.loaded:
+            case_base.add_many(records)
+        self.imported += len(records)
+        self.chunks += 1
+        self.chunk = []
+
+    def _error(self, line_no: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def report(self) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_ms": round((time.perf_counter() - self._t0) * 1000, 1),
+        }
+
+
+def insert_chunk(db: Session, chunk: List[RetainRequest]) -> List[CaseRecord]:
+    # los Case se vuelcan juntos para obtener los ids (insertmanyvalues donde el driver lo soporta)
+    cases = [models.Case(disease_code=p.disease_code, notes=p.notes) for p in chunk]
+    db.add_all(cases)
+    db.flush()
+    ids = [c.id for c in cases]
+    weight_rows: List[Dict] = []
+    solution_rows: List[Dict] = []
+    for case_id, p in zip(ids, chunk):
+        weight_rows.extend(
+            {"case_id": case_id, "symptom_code": k, "weight": float(w)} for k, w in p.symptom_weights.items()
+        )
+        solution_rows.extend({"case_id": case_id, "solution_code": s} for s in dict.fromkeys(p.solutions))
+    if weight_rows:
+        db.execute(insert(models.CaseSymptomWeight), weight_rows)
+    if solution_rows:
+        db.execute(insert(models.CaseSolution), solution_rows)
+    db.commit()
+    db.expunge_all()
+    return [
+        CaseRecord(case_id, p.disease_code, refdata.disease_names[p.disease_code], p.symptom_weights, sorted(set(p.solutions)))
+        for case_id, p in zip(ids, chunk)
+    ]
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Parte un cuerpo en streaming en líneas sin cargarlo entero."""
+    buf = b""
+    async for data in chunks:
+        buf += data
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if buf:
+        yield buf.decode("utf-8", errors="replace")
+
+
+def import_file(path: str, fmt: Optional[str] = None, chunk_size: int = IMPORT_CHUNK_SIZE, progress=None) -> dict:
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    job = BulkImport(chunk_size)
+    with open(path, newline="", encoding="utf-8") as fh, SessionLocal() as db:
+        refdata.load(db)
+        rows = parse_csv(fh) if fmt == "csv" else parse_jsonl(fh)
+        for line_no, raw in rows:
+            if job.feed(line_no, raw):
+                job.flush(db)
+                if progress:
+                    progress(job)
+        job.flush(db)
+    return job.report()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=("csv", "jsonl"))
+    ap.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    def progress(job: BulkImport):
+        print(f"... {job.imported} importados, {job.failed} con error", file=sys.stderr)
+
+    report = import_file(args.path, args.format, args.chunk_size, progress)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,25 @@
 # app/main.py (fragmento)
+import time
+_T_IMPORT = time.perf_counter()
+
+import asyncio
+import logging
 import os
-from fastapi import FastAPI
-from .seed import bootstrap_if_empty
-from .db import Base, engine
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from .db import engine, async_engine, read_engine, read_async_engine, ReadSessionLocal
+from .casebase import case_base
+from .refdata import refdata
+from .cache import result_cache
+from .executor import executor
+from . import audit, startup, subscriptions, telemetry
 from .api import router as api_router
 
 API_PREFIX = os.getenv("API_PREFIX", "").rstrip("/")
+# cada cuántos segundos se reconcilia el case base con lo que cambiaron otros workers (0 = nunca)
+CASEBASE_REFRESH_SECONDS = float(os.getenv("CASEBASE_REFRESH_SECONDS", "30"))
+
+log = logging.getLogger("psych_cbr.main")
 
 def pref(path: str) -> str:
     return f"{API_PREFIX}{path}" if API_PREFIX else path
@@ -19,13 +33,117 @@ app = FastAPI(
 )
 
 app.include_router(api_router, prefix=pref(""))
+# /metrics y las sondas no se miden a sí mismos; los streams SSE duran lo que la conexión
+app.add_middleware(
+    telemetry.TelemetryMiddleware,
+    exclude=(pref("/metrics"), pref("/health"), pref("/ready"), pref("/v1/subscriptions/sse")),
+)
+# con DATABASE_READ_URL, la réplica tiene sus propios pools
+ENGINES = {"sync": engine, "async": async_engine.sync_engine}
+if read_engine is not engine:
+    ENGINES.update({"read_sync": read_engine, "read_async": read_async_engine.sync_engine})
+for _eng in ENGINES.values():
+    telemetry.instrument_engine(_eng)
+
+startup.mark("import", _T_IMPORT)
 
 @app.get(pref("/health"))
 def health():
     return {"status": "ok"}
 
+@app.get(pref("/ready"))
+def ready():
+    # 503 mientras la precarga de STARTUP_MODE=lazy no termina
+    body = {"ready": startup.ready, "mode": startup.STARTUP_MODE, "ddl_applied": startup.ddl_applied,
+            "startup_s": startup.timings}
+    return JSONResponse(body, status_code=200 if startup.ready else 503)
+
+@app.get(pref("/metrics"))
+def metrics():
+    body = telemetry.render(
+        ENGINES,
+        {
+            "cbr_case_base_cases": len(case_base),
+            "cbr_case_base_version": case_base.version,
+            "cbr_result_cache_entries": len(result_cache),
+            "cbr_audit_queue_depth": audit.writer.stats()["depth"],
+            "cbr_ready": int(startup.ready),
+            "cbr_subscriptions": len(subscriptions.registry),
+            "cbr_retrieve_in_flight": executor.in_flight,
+            "cbr_startup_seconds": startup.timings.get("total", 0.0),
+        },
+        {"cbr_retrieve_rejected_total": executor.rejected},
+    )
+    return Response(content=body, media_type="text/plain; version=0.0.4")
+
+@app.get(pref("/stats"))
+def stats():
+    return {
+        "case_base": {"cases": len(case_base), "version": case_base.version},
+        "refdata": {"version": refdata.version, "fresh": refdata.fresh},
+        "result_cache": result_cache.stats(),
+        "audit": audit.writer.stats(),
+        "retrieve_executor": executor.stats(),
+        "startup": {"mode": startup.STARTUP_MODE, "ready": startup.ready, "seconds": startup.timings},
+    }
+
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
-    if os.getenv("SEED_ON_STARTUP", "false").lower() in ("1", "true", "yes"):
+    t_start = t0 = time.perf_counter()
+    startup.ddl_applied = startup.ensure_schema(engine)
+    t0 = startup.mark("schema", t0)
+    # worker_id propio para los ids de consulta, aunque todos los workers compartan el .env
+    audit.ids.reserve(engine)
+    app.state.worker_lease = asyncio.get_event_loop().create_task(_renew_worker_lease())
+    if startup.SEED_ON_STARTUP:
+        from .seed import bootstrap_if_empty
+
         bootstrap_if_empty()
+        startup.mark("seed", t0)
+    if startup.STARTUP_MODE == "lazy":
+        startup.start_warmup(t_start)
+    else:
+        startup.warm()
+        startup.finish(t_start)
+    if CASEBASE_REFRESH_SECONDS > 0:
+        app.state.casebase_refresh = asyncio.get_event_loop().create_task(_refresh_case_base())
+
+
+@app.on_event("startup")
+async def start_audit_writer():
+    if audit.AUDIT_ASYNC:
+        audit.writer.start()
+
+@app.on_event("shutdown")
+async def stop_audit_writer():
+    # drena la cola para no perder consultas
+    await audit.writer.stop()
+    audit.ids.release(engine)
+    executor.shutdown()
+    await async_engine.dispose()
+    if read_async_engine is not async_engine:
+        await read_async_engine.dispose()
+
+
+def _refresh_once() -> int:
+    with ReadSessionLocal() as db:
+        return case_base.refresh(db)
+
+
+async def _refresh_case_base():
+    while True:
+        await asyncio.sleep(CASEBASE_REFRESH_SECONDS)
+        try:
+            # fuera del event loop: consulta y conjuntos no bloquean las requests
+            await asyncio.to_thread(_refresh_once)
+        except Exception:
+            log.exception("case-base refresh failed")
+
+
+async def _renew_worker_lease():
+    while True:
+        await asyncio.sleep(audit.WORKER_LEASE_SECONDS / 3)
+        try:
+            await asyncio.to_thread(audit.ids.renew, engine)
+        except Exception:
+            log.exception("worker_id lease renewal failed")
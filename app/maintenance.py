@@ -0,0 +1,234 @@
+"""Mantenimiento del case base: detección de casos redundantes y compactación.
+
+    python -m app.maintenance                   # informe (no cambia nada)
+    python -m app.maintenance --threshold 0.85 --apply
+
+Dos casos de la misma enfermedad son redundantes si tienen exactamente los
+mismos pesos (duplicado) o si su Jaccard ponderado (suma de mínimos / suma de
+máximos) llega a `threshold` (casi duplicado). Nunca se comparan todos contra
+todos:
+
+- duplicados exactos: una clave por (enfermedad, pesos) en un dict;
+- casi duplicados: bloques por MinHash-LSH (app/ann.py) con la enfermedad
+  mezclada en la clave de cada banda; dentro de cada bucket solo se emparejan
+  casos de peso total compatible con el umbral, y los pares se verifican en
+  bloque con NumPy. El blocking es probabilístico (puede escapar algún par muy
+  justo de umbral), la verificación es exacta.
+
+Se conserva el caso más antiguo de cada grupo, se le añaden las soluciones de
+los redundantes y estos pasan a is_active = False, todo con INSERT/UPDATE por
+bloques. El informe incluye casos activos antes/después y el speedup medido de
+retrieve sobre consultas tomadas del propio case base.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+# casebase antes que matrix: con CASEBASE_SNAPSHOT_PATH, casebase importa mapped, que importa matrix
+from .casebase import CASEBASE_SNAPSHOT_PATH, CaseRecord, _load_records, case_base
+from . import matrix, models
+from .ann import LSHIndex
+from .db import SessionLocal
+
+MAINTENANCE_THRESHOLD = float(os.getenv("MAINTENANCE_THRESHOLD", "0.9"))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+# vecinos (en orden de peso total dentro de cada bucket) con los que se compara cada caso
+_WINDOW = 64
+# pares verificados por bloque (matrices densas de pares x síntomas)
+_VERIFY_CHUNK = 50_000
+
+
+def _candidate_pairs(records: Sequence[CaseRecord], totals: np.ndarray, threshold: float,
+                     bands: int = 16, rows: int = 4) -> np.ndarray:
+    """Pares (i, j), i < j, de la misma enfermedad que comparten algún bucket LSH.
+
+    Jaccard ponderado >= t exige min(total)/max(total) >= t, así que dentro de
+    cada bucket se ordena por peso total y solo se emparejan vecinos cercanos
+    que cumplen esa cota.
+    """
+    lsh = LSHIndex(bands, rows)
+    keys = lsh._record_keys(list(records))
+    disease = np.fromiter((zlib.crc32(r.disease_code.encode()) for r in records), dtype=np.uint64, count=len(records))
+    keys ^= disease[:, None]
+    n = len(records)
+    found = []
+    for band in range(bands):
+        order = np.lexsort((totals, keys[:, band]))
+        k, tt = keys[order, band], totals[order]
+        for d in range(1, min(_WINDOW, n - 1) + 1):
+            ok = (k[:-d] == k[d:]) & (tt[:-d] >= threshold * tt[d:])
+            if not ok.any():
+                break
+            a, b = order[:-d][ok], order[d:][ok]
+            found.append(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    codes = np.unique(np.concatenate(found))
+    return np.stack([codes // n, codes % n], axis=1)
+
+
+def _verify(m: "matrix.CaseMatrix", pairs: np.ndarray, threshold: float) -> np.ndarray:
+    """Pares con Jaccard ponderado >= threshold, calculado en bloques densos."""
+    width = len(m.columns)
+    keep = []
+    for start in range(0, pairs.shape[0], _VERIFY_CHUNK):
+        chunk = pairs[start:start + _VERIFY_CHUNK]
+        dense = []
+        for col in (0, 1):
+            rows_ = chunk[:, col]
+            counts = np.diff(m.indptr)[rows_]
+            src = np.repeat(m.indptr[rows_] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+            out = np.zeros((chunk.shape[0], width))
+            out[np.repeat(np.arange(chunk.shape[0]), counts), m.indices[src]] = m.data[src]
+            dense.append(out)
+        num = np.minimum(dense[0], dense[1]).sum(axis=1)
+        den = np.maximum(dense[0], dense[1]).sum(axis=1)
+        sim = np.divide(num, den, out=np.ones_like(num), where=den > 0)
+        keep.append(chunk[sim >= threshold])
+    return np.concatenate(keep) if keep else pairs[:0]
+
+
+def find_redundant(records: Sequence[CaseRecord], threshold: float = MAINTENANCE_THRESHOLD) -> Tuple[Dict[int, int], int]:
+    """({id redundante: id del caso que se conserva}, nº de duplicados exactos); `records` ordenados por id."""
+    merged: Dict[int, int] = {}
+
+    # 1) duplicados exactos
+    first: Dict[tuple, int] = {}
+    reps: List[CaseRecord] = []
+    for r in records:
+        key = (r.disease_code, tuple(r.weights.items()))
+        keeper = first.get(key)
+        if keeper is None:
+            first[key] = r.id
+            reps.append(r)
+        else:
+            merged[r.id] = keeper
+    exact = len(merged)
+
+    # 2) casi duplicados entre los representantes: el más antiguo absorbe a los posteriores
+    if threshold < 1.0 and len(reps) > 1:
+        m = matrix.CaseMatrix(0, reps)
+        totals = np.fromiter((sum(r.weights.values()) for r in reps), dtype=np.float64, count=len(reps))
+        pairs = _verify(m, _candidate_pairs(reps, totals, threshold), threshold)
+        neighbors: Dict[int, List[int]] = {}
+        for i, j in pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))].tolist():
+            neighbors.setdefault(j, []).append(i)
+        kept: Set[int] = set()
+        for j, r in enumerate(reps):
+            keeper = next((i for i in neighbors.get(j, ()) if i in kept), None)
+            if keeper is None:
+                kept.add(j)
+            else:
+                merged[r.id] = reps[keeper].id
+    return merged, exact
+
+
+def _measure(records: Sequence[CaseRecord], queries: List[Dict[str, float]], top_k: int = 5) -> float:
+    """Segundos por consulta con el kernel de matrix (fuera de la caché de app/matrix.py)."""
+    m = matrix.CaseMatrix(0, records)
+    best = float("inf")
+    for _ in range(3):  # la mejor de 3 pasadas, para no medir ruido
+        t0 = time.perf_counter()
+        for q in queries:
+            matrix.retrieve(m, q, top_k)
+        best = min(best, time.perf_counter() - t0)
+    return best / max(1, len(queries))
+
+
+def _apply(db: Session, merged: Dict[int, int], by_id: Dict[int, CaseRecord]) -> Dict[int, List[str]]:
+    """Soluciones añadidas a cada caso conservado; desactiva los redundantes por bloques."""
+    extra: Dict[int, Set[str]] = {}
+    for dup, keeper in merged.items():
+        missing = set(by_id[dup].solutions) - set(by_id[keeper].solutions)
+        if missing:
+            extra.setdefault(keeper, set()).update(missing)
+    rows = [{"case_id": k, "solution_code": s} for k, codes in extra.items() for s in sorted(codes)]
+    for start in range(0, len(rows), MAINTENANCE_BATCH_SIZE):
+        db.execute(insert(models.CaseSolution), rows[start:start + MAINTENANCE_BATCH_SIZE])
+    # updated_at de los conservados: el refresco de los otros workers recarga sus soluciones
+    keepers = sorted(extra)
+    for start in range(0, len(keepers), MAINTENANCE_BATCH_SIZE):
+        db.execute(
+            update(models.Case)
+            .where(models.Case.id.in_(keepers[start:start + MAINTENANCE_BATCH_SIZE]))
+            .values(updated_at=func.now())
+        )
+    ids = sorted(merged)
+    for start in range(0, len(ids), MAINTENANCE_BATCH_SIZE):
+        db.execute(
+            update(models.Case)
+            .where(models.Case.id.in_(ids[start:start + MAINTENANCE_BATCH_SIZE]))
+            .values(is_active=False)
+        )
+    db.commit()
+    return {k: sorted(v) for k, v in extra.items()}
+
+
+def compact(threshold: float = MAINTENANCE_THRESHOLD, apply: bool = False,
+            db: Optional[Session] = None, sample_queries: int = 200) -> dict:
+    """Busca redundantes y, con apply=True, los desactiva y sincroniza el case base en memoria."""
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        records = _load_records(db)
+        merged, exact = find_redundant(records, threshold)
+        detect_s = time.perf_counter() - t0
+
+        kept = [r for r in records if r.id not in merged]
+        step = max(1, len(records) // sample_queries)
+        queries = [dict(r.weights) for r in records[::step]][:sample_queries]
+        before = _measure(records, queries)
+        after = _measure(kept, queries)
+
+        report = {
+            "threshold": threshold,
+            "applied": apply,
+            "active_before": len(records),
+            "active_after": len(kept),
+            "redundant": len(merged),
+            "exact_duplicates": exact,
+            "reduction_pct": round(100.0 * len(merged) / len(records), 2) if records else 0.0,
+            "retrieve_ms_before": round(before * 1000, 3),
+            "retrieve_ms_after": round(after * 1000, 3),
+            "speedup": round(before / after, 2) if after > 0 else None,
+            "detect_s": round(detect_s, 2),
+        }
+        if apply and merged:
+            by_id = {r.id: r for r in records}
+            extra = _apply(db, merged, by_id)
+            report["solutions_merged"] = sum(len(v) for v in extra.values())
+            # desde la CLI el case base no está cargado, pero el archivo compartido sí existe:
+            # se publica ahí para que los workers lo vean y no sobreviva a un reinicio
+            if case_base.loaded or (CASEBASE_SNAPSHOT_PATH and os.path.exists(CASEBASE_SNAPSHOT_PATH)):
+                case_base.discard_many(merged)
+                keepers = sorted(extra)
+                case_base.add_many([
+                    r for start in range(0, len(keepers), MAINTENANCE_BATCH_SIZE)
+                    for r in _load_records(db, ids=keepers[start:start + MAINTENANCE_BATCH_SIZE])
+                ])
+        return report
+    finally:
+        if own:
+            db.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threshold", type=float, default=MAINTENANCE_THRESHOLD)
+    ap.add_argument("--apply", action="store_true", help="desactivar los redundantes (sin esto solo informa)")
+    args = ap.parse_args(argv)
+    print(json.dumps(compact(args.threshold, args.apply), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
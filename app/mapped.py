@@ -0,0 +1,347 @@
+"""Case base compartido entre workers: snapshot binario mapeado en memoria (mmap).
+
+El archivo guarda la matriz CSR de pesos, totales, normas, enfermedad y
+soluciones de cada caso, más las tablas de códigos. Cada worker lo mapea en
+solo lectura: las páginas viven una sola vez en la caché del sistema, el
+arranque no recorre la DB y todos los workers puntúan contra los mismos datos.
+
+Un cambio (retain, desactivación, refresh) se publica escribiendo un archivo
+nuevo con `generation + 1` y renombrándolo encima del anterior (os.replace es
+atómico); los demás workers lo detectan con un stat y lo remapean. Las
+escrituras se serializan con flock sobre `<ruta>.lock`. La generación hace de
+versión del case base, igual en todos los workers.
+
+Formato: MAGIC, longitud (uint32) y cabecera JSON (generación, tablas y
+offset/dtype/longitud de cada array), seguida de los arrays alineados a 64 bytes.
+"""
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+from typing import Iterator, List, Optional, Sequence, Set
+
+import numpy as np
+
+from .casebase import CaseBase, CaseRecord, Snapshot, _load_records
+from .data import SYMPTOMS
+from .matrix import CaseMatrix, _encode
+
+MAGIC = b"CBRSNAP1"
+_ALIGN = 64
+# nombre -> dtype de cada array del archivo
+_ARRAYS = {
+    "ids": np.int64,
+    "disease": np.int32,
+    "indptr": np.int64,
+    "indices": np.int32,
+    "data": np.float64,
+    "totals": np.float64,
+    "sol_indptr": np.int64,
+    "sol": np.int32,
+}
+
+
+class SnapshotFile:
+    """Vista de solo lectura sobre un archivo de snapshot (arrays sin copiar)."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: no es un snapshot del case base")
+        (hlen,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        header = json.loads(self._mm[len(MAGIC) + 4:len(MAGIC) + 4 + hlen])
+        self.generation: int = header["generation"]
+        self.columns: List[str] = header["columns"]
+        self.diseases: List[List[str]] = header["diseases"]
+        self.solutions: List[str] = header["solutions"]
+        arrays = {
+            name: np.frombuffer(self._mm, dtype=_ARRAYS[name], count=count, offset=offset)
+            for name, (offset, count) in header["arrays"].items()
+        }
+        self.ids = arrays["ids"]
+        self.disease = arrays["disease"]
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.data = arrays["data"]
+        self.totals = arrays["totals"]
+        self.sol_indptr = arrays["sol_indptr"]
+        self.sol = arrays["sol"]
+        self.n = self.ids.shape[0]
+        # derivados: una copia por worker, pero del tamaño de nnz/n y no de objetos Python
+        self.rows = np.repeat(np.arange(self.n, dtype=np.int32), np.diff(self.indptr))
+        self.norms = np.sqrt(np.bincount(self.rows, weights=self.data * self.data, minlength=self.n))
+
+    def record(self, i: int) -> CaseRecord:
+        lo, hi = int(self.indptr[i]), int(self.indptr[i + 1])
+        code, name = self.diseases[self.disease[i]]
+        return CaseRecord(
+            int(self.ids[i]), code, name,
+            {self.columns[c]: float(w) for c, w in zip(self.indices[lo:hi], self.data[lo:hi])},
+            [self.solutions[s] for s in self.sol[self.sol_indptr[i]:self.sol_indptr[i + 1]]],
+        )
+
+    def matrix(self) -> CaseMatrix:
+        return CaseMatrix.from_arrays(
+            self.generation, LazyRecords(self), {c: i for i, c in enumerate(self.columns)},
+            self.indptr, self.indices, self.data, self.rows, self.totals, self.norms,
+        )
+
+
+class LazyRecords(Sequence):
+    """Casos del archivo como secuencia: cada CaseRecord se crea al pedirlo (solo los ganadores)."""
+
+    __slots__ = ("_f",)
+
+    def __init__(self, f: SnapshotFile):
+        self._f = f
+
+    def __len__(self) -> int:
+        return self._f.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._f.record(j) for j in range(*i.indices(self._f.n))]
+        if i < 0:
+            i += self._f.n
+        if not 0 <= i < self._f.n:
+            raise IndexError(i)
+        return self._f.record(i)
+
+    def __iter__(self) -> Iterator[CaseRecord]:
+        return (self._f.record(i) for i in range(self._f.n))
+
+
+def _take_rows(indptr: np.ndarray, order: np.ndarray, *values: np.ndarray):
+    """Filas `order` de un CSR (indptr + arrays por elemento), en ese orden."""
+    counts = np.diff(indptr)[order]
+    new_indptr = np.zeros(order.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_indptr[1:])
+    src = np.repeat(indptr[:-1][order] - new_indptr[:-1], counts) + np.arange(new_indptr[-1], dtype=np.int64)
+    return (new_indptr, *(v[src] for v in values))
+
+
+def write_snapshot(path: str, generation: int, base: Optional[SnapshotFile],
+                   keep: Optional[np.ndarray], records: Sequence[CaseRecord]) -> None:
+    """Escribe (base filtrada por `keep`) + records, ordenado por id, y lo publica con os.replace."""
+    columns = {c: i for i, c in enumerate(base.columns if base else SYMPTOMS)}
+    diseases = [list(d) for d in base.diseases] if base else []
+    solutions = list(base.solutions) if base else []
+    d_index = {code: i for i, (code, _) in enumerate(diseases)}
+    s_index = {code: i for i, code in enumerate(solutions)}
+
+    if base is not None:
+        order = np.flatnonzero(keep) if keep is not None else np.arange(base.n)
+        indptr, indices, data = _take_rows(base.indptr, order, base.indices, base.data)
+        sol_indptr, sol = _take_rows(base.sol_indptr, order, base.sol)
+        ids, disease, totals = base.ids[order], base.disease[order], base.totals[order]
+    else:
+        indptr, sol_indptr = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        indices, sol, disease = (np.empty(0, dtype=np.int32) for _ in range(3))
+        data, totals = np.empty(0), np.empty(0)
+        ids = np.empty(0, dtype=np.int64)
+
+    if records:
+        new_indptr, new_indices, new_data = _encode(records, columns)
+        new_disease, new_sol, new_sol_indptr = [], [], [0]
+        for r in records:
+            if r.disease_code not in d_index:
+                d_index[r.disease_code] = len(diseases)
+                diseases.append([r.disease_code, r.disease_name])
+            new_disease.append(d_index[r.disease_code])
+            for code in r.solutions:
+                if code not in s_index:
+                    s_index[code] = len(solutions)
+                    solutions.append(code)
+                new_sol.append(s_index[code])
+            new_sol_indptr.append(len(new_sol))
+        ids = np.concatenate([ids, np.fromiter((r.id for r in records), dtype=np.int64, count=len(records))])
+        disease = np.concatenate([disease, np.asarray(new_disease, dtype=np.int32)])
+        totals = np.concatenate([totals, np.fromiter((r.total_weight for r in records), dtype=np.float64, count=len(records))])
+        indptr = np.concatenate([indptr, np.asarray(new_indptr[1:], dtype=np.int64) + indptr[-1]])
+        indices = np.concatenate([indices, np.asarray(new_indices, dtype=np.int32)])
+        data = np.concatenate([data, np.asarray(new_data, dtype=np.float64)])
+        sol_indptr = np.concatenate([sol_indptr, np.asarray(new_sol_indptr[1:], dtype=np.int64) + sol_indptr[-1]])
+        sol = np.concatenate([sol, np.asarray(new_sol, dtype=np.int32)])
+
+        # mismo orden que CaseBase.snapshot(): por id (los empates se resuelven por posición)
+        if ids.shape[0] > 1 and np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")
+            indptr, indices, data = _take_rows(indptr, order, indices, data)
+            sol_indptr, sol = _take_rows(sol_indptr, order, sol)
+            ids, disease, totals = ids[order], disease[order], totals[order]
+
+    arrays = {
+        "ids": ids, "disease": disease, "indptr": indptr, "indices": indices, "data": data,
+        "totals": totals, "sol_indptr": sol_indptr, "sol": sol,
+    }
+    header = {
+        "generation": generation,
+        "columns": [c for c, _ in sorted(columns.items(), key=lambda kv: kv[1])],
+        "diseases": diseases,
+        "solutions": solutions,
+        "arrays": {},
+    }
+    # los offsets dependen del tamaño de la cabecera: se reserva con una primera pasada
+    blobs = {name: np.ascontiguousarray(a, dtype=_ARRAYS[name]).tobytes() for name, a in arrays.items()}
+    for _ in range(2):
+        hbytes = json.dumps(header).encode()
+        offset = _aligned(len(MAGIC) + 4 + len(hbytes) + 64)
+        for name, a in arrays.items():
+            header["arrays"][name] = [offset, int(a.shape[0])]
+            offset = _aligned(offset + len(blobs[name]))
+    hbytes = json.dumps(header).encode()
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + struct.pack("<I", len(hbytes)) + hbytes)
+        for name in arrays:
+            pad = header["arrays"][name][0] - fh.tell()
+            assert pad >= 0, "cabecera más larga que el espacio reservado"
+            fh.write(b"\0" * pad)
+            fh.write(blobs[name])
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class MappedCaseBase(CaseBase):
+    """CaseBase respaldado por el archivo compartido en lugar de objetos por worker."""
+
+    # quien cambia un caso ya publica la generación nueva: recargarlo en cada worker la repetiría
+    _reload_changed = False
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._file: Optional[SnapshotFile] = None
+        self._stat: Optional[tuple] = None
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Lock del proceso y flock entre workers para publicar una generación."""
+        with self._lock, open(self.path + ".lock", "a") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                yield
+            finally:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _sync(self) -> bool:
+        """Remapea si otro worker publicó un archivo nuevo; True si cambió."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._stat:
+            return False
+        old, f = self._file, SnapshotFile(self.path)
+        self._file, self._stat = f, key
+        self.version = f.generation
+        self._snapshot = Snapshot(f.generation, LazyRecords(f), f.matrix())
+        if self._indexes:
+            self._notify(old, f)
+        return True
+
+    def _notify(self, old: Optional[SnapshotFile], new: SnapshotFile) -> None:
+        """Pasa a los índices enganchados (p. ej. app/subscriptions.py) lo que cambió entre dos generaciones.
+
+        Vale igual para lo publicado por este worker y por otros: los ids que
+        entran se ofrecen con add y los que salen, con discard.
+        """
+        if old is None:
+            for ix in self._indexes:
+                ix.reset(LazyRecords(new))
+            return
+        gone = old.ids[~np.isin(old.ids, new.ids)].tolist()
+        added = np.flatnonzero(~np.isin(new.ids, old.ids)).tolist()
+        for case_id in gone:
+            for ix in self._indexes:
+                ix.discard(case_id)
+        for i in added:
+            record = new.record(i)
+            for ix in self._indexes:
+                ix.add(record)
+
+    def attach(self, index, built_from: Optional[Snapshot] = None) -> None:
+        # el índice se repuebla entero: el archivo no guarda qué generación vio built_from
+        with self._lock:
+            self._sync()
+            index.reset(LazyRecords(self._file) if self._file is not None else [])
+            self._indexes.append(index)
+
+    def _publish(self, keep: Optional[np.ndarray], records: Sequence[CaseRecord]) -> None:
+        f = self._file
+        write_snapshot(self.path, (f.generation if f else 0) + 1, f, keep, records)
+        self._sync()
+
+    def load(self, db) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._exclusive():
+            if self._file is None:
+                # primer worker sin archivo: se construye desde la DB
+                self._publish(None, _load_records(db))
+            self.loaded = True
+        self.refresh(db)
+
+    def _known_ids(self, ids: Sequence[int]) -> Set[int]:
+        with self._lock:
+            self._sync()
+            if self._file is None or not ids:
+                return set()
+            ids = np.asarray(ids, dtype=np.int64)
+            return set(ids[np.isin(ids, self._file.ids)].tolist())
+
+    def add_many(self, records) -> None:
+        records = list(records)
+        if not records:
+            return
+        with self._exclusive():
+            f = self._file
+            keep = None
+            if f is not None and f.n:
+                keep = ~np.isin(f.ids, np.fromiter((r.id for r in records), dtype=np.int64, count=len(records)))
+            self._publish(keep, sorted(records, key=lambda r: r.id))
+            # _sync ya notificó los ids nuevos; los reemplazados (mismo id) no se ven en la diferencia
+            replaced = set(f.ids[~keep].tolist()) if keep is not None else set()
+            for record in records:
+                if record.id in replaced:
+                    for ix in self._indexes:
+                        ix.discard(record.id)
+                        ix.add(record)
+
+    def discard_many(self, case_ids) -> None:
+        ids = np.fromiter(case_ids, dtype=np.int64)
+        with self._exclusive():
+            f = self._file
+            if f is None or not ids.size:
+                return
+            keep = ~np.isin(f.ids, ids)
+            if not keep.all():
+                # los índices se enteran en _sync, como con lo publicado por otros workers
+                self._publish(keep, [])
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            self._sync()
+            return self._snapshot
+
+    def snapshot_at_least(self, generation: int) -> Optional[Snapshot]:
+        """Como snapshot(), pero remapea aunque el stat no cambie si va por detrás de `generation`."""
+        with self._lock:
+            self._sync()
+            if self._file is not None and self._file.generation < generation:
+                self._stat = None
+                self._sync()
+            return self._snapshot
+
+    def __len__(self) -> int:
+        return self._file.n if self._file is not None else 0
@@ -0,0 +1,209 @@
+"""Motor de retrieve vectorizado: case base como matriz CSR sobre los síntomas."""
+import math
+import threading
+from typing import Dict, FrozenSet, List, Sequence, Tuple
+
+import numpy as np
+
+from . import similarity
+from .casebase import CaseRecord, Snapshot
+from .data import SYMPTOMS
+
+
+class CaseMatrix:
+    """CSR (indptr/indices/data) de pesos por caso, con totales y normas precalculados."""
+
+    __slots__ = ("version", "records", "columns", "indptr", "indices", "data", "rows", "totals", "norms")
+
+    def __init__(self, version: int, records: Sequence[CaseRecord], columns: Dict[str, int] | None = None):
+        self.version = version
+        self.records = tuple(records)
+        self.columns = dict(columns) if columns else {code: i for i, code in enumerate(SYMPTOMS)}
+        indptr, indices, data = _encode(self.records, self.columns)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.rows = np.repeat(np.arange(len(self.records), dtype=np.int32), np.diff(self.indptr))
+        self.totals = np.fromiter((r.total_weight for r in self.records), dtype=np.float64, count=len(self.records))
+        self.norms = self._norms()
+
+    @classmethod
+    def from_arrays(cls, version: int, records: Sequence[CaseRecord], columns: Dict[str, int],
+                    indptr, indices, data, rows, totals, norms) -> "CaseMatrix":
+        """Matriz sobre arrays ya calculados (p. ej. de solo lectura en un mmap), sin copiarlos."""
+        m = cls.__new__(cls)
+        m.version = version
+        m.records = records
+        m.columns = dict(columns)
+        m.indptr, m.indices, m.data, m.rows = indptr, indices, data, rows
+        m.totals, m.norms = totals, norms
+        return m
+
+    def extend(self, version: int, new_records: Sequence[CaseRecord]) -> "CaseMatrix":
+        """Nueva matriz con filas añadidas al final, sin recodificar las existentes."""
+        m = CaseMatrix.__new__(CaseMatrix)
+        m.version = version
+        m.records = self.records + tuple(new_records)
+        m.columns = dict(self.columns)
+        indptr, indices, data = _encode(new_records, m.columns)
+        offset = int(self.indptr[-1])
+        m.indptr = np.concatenate([self.indptr, np.asarray(indptr[1:], dtype=np.int64) + offset])
+        m.indices = np.concatenate([self.indices, np.asarray(indices, dtype=np.int32)])
+        m.data = np.concatenate([self.data, np.asarray(data, dtype=np.float64)])
+        m.rows = np.repeat(np.arange(len(m.records), dtype=np.int32), np.diff(m.indptr))
+        m.totals = np.concatenate([
+            self.totals,
+            np.fromiter((r.total_weight for r in new_records), dtype=np.float64, count=len(new_records)),
+        ])
+        m.norms = m._norms()
+        return m
+
+    def _norms(self) -> np.ndarray:
+        return np.sqrt(np.bincount(self.rows, weights=self.data * self.data, minlength=len(self.records)))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def query_vector(self, weights: Dict[str, float]) -> np.ndarray:
+        # indicador 0/1: la similitud solo usa los síntomas presentes en la consulta
+        q = np.zeros(len(self.columns), dtype=np.float64)
+        for code in weights:
+            col = self.columns.get(code)
+            if col is not None:
+                q[col] = 1.0
+        return q
+
+    def weight_vector(self, weights: Dict[str, float]) -> np.ndarray:
+        q = np.zeros(len(self.columns), dtype=np.float64)
+        for code, w in weights.items():
+            col = self.columns.get(code)
+            if col is not None:
+                q[col] = w
+        return q
+
+    def reductions(self, weights: Dict[str, float], needs: FrozenSet[str]) -> Dict[str, np.ndarray]:
+        """Kernel común de similarity: solo las reducciones por caso que pide la métrica."""
+        n = len(self.records)
+        out: Dict[str, np.ndarray] = {}
+        if "match" in needs:
+            out["match"] = self.match_weights(self.query_vector(weights))
+        if needs & {"dot", "min"}:
+            qw = self.weight_vector(weights)[self.indices]
+            if "dot" in needs:
+                out["dot"] = np.bincount(self.rows, weights=self.data * qw, minlength=n)
+            if "min" in needs:
+                out["min"] = np.bincount(self.rows, weights=np.minimum(self.data, qw), minlength=n)
+        return out
+
+    def score(self, weights: Dict[str, float], metric: str = similarity.DEFAULT_METRIC, **params) -> np.ndarray:
+        met = similarity.get(metric)
+        q = similarity.Query(
+            total=float(sum(weights.values())),
+            norm=math.sqrt(sum(w * w for w in weights.values())),
+        )
+        return met.score(self.reductions(weights, met.needs), self, q, **params)
+
+    def match_weights(self, q: np.ndarray) -> np.ndarray:
+        """Producto matriz-vector: peso de la intersección por caso."""
+        return np.bincount(self.rows, weights=self.data * q[self.indices], minlength=len(self.records))
+
+    def match_weights_many(self, Q: np.ndarray) -> np.ndarray:
+        """Producto matriz-matriz (consultas x casos) en bloques de tamaño acotado.
+
+        Se usa bincount sobre las filas desplazadas por consulta para sumar en el
+        mismo orden que match_weights y obtener exactamente los mismos valores.
+        """
+        n, nnz = len(self.records), self.indices.shape[0]
+        out = np.zeros((Q.shape[0], n), dtype=np.float64)
+        if nnz == 0:
+            return out
+        step = max(1, _BLOCK_ELEMS // nnz)
+        for start in range(0, Q.shape[0], step):
+            block = Q[start:start + step]
+            b = block.shape[0]
+            contrib = block[:, self.indices] * self.data
+            bins = (np.arange(b, dtype=np.int64)[:, None] * n + self.rows).ravel()
+            out[start:start + b] = np.bincount(bins, weights=contrib.ravel(), minlength=b * n).reshape(b, n)
+        return out
+
+
+def _encode(records: Sequence[CaseRecord], columns: Dict[str, int]) -> Tuple[List[int], List[int], List[float]]:
+    indptr = [0]
+    indices: List[int] = []
+    data: List[float] = []
+    for r in records:
+        # r.weights ya viene ordenado por código: mismo orden de suma que cbr.retrieve
+        for code, w in r.weights.items():
+            col = columns.get(code)
+            if col is None:
+                col = columns[code] = len(columns)
+            indices.append(col)
+            data.append(w)
+        indptr.append(len(indices))
+    return indptr, indices, data
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Top-k por score descendente; empates por posición, igual que un sort estable."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[part].min()
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - above.size]
+        idx = np.concatenate([above, ties])
+    else:
+        idx = np.arange(n)
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+# elementos (consultas x nnz) por bloque en match_weights_many
+_BLOCK_ELEMS = 4_000_000
+
+_lock = threading.Lock()
+_current: CaseMatrix | None = None
+
+
+def for_snapshot(snap: Snapshot) -> CaseMatrix:
+    """Matriz de la versión del snapshot; si solo hay casos nuevos al final, la extiende."""
+    global _current
+    if snap.matrix is not None:
+        return snap.matrix
+    m = _current
+    if m is not None and m.version == snap.version:
+        return m
+    with _lock:
+        m = _current
+        if m is None or m.version != snap.version:
+            n = len(m.records) if m is not None else 0
+            if m is not None and len(snap.records) >= n and snap.records[:n] == m.records:
+                m = m.extend(snap.version, snap.records[n:])
+            else:
+                m = CaseMatrix(snap.version, snap.records)
+            _current = m
+        return m
+
+
+def _winners(m: CaseMatrix, scores: np.ndarray, weights: Dict[str, float], top_k: int):
+    from .cbr import compare
+
+    results = []
+    for i in top_k_indices(scores, top_k):
+        rec = m.records[i]
+        results.append((rec, float(scores[i]), compare(rec, weights)[1]))
+    return results
+
+
+def retrieve(m: CaseMatrix, weights: Dict[str, float], top_k: int, metric: str = similarity.DEFAULT_METRIC, **params):
+    return _winners(m, m.score(weights, metric, **params), weights, top_k)
+
+
+def retrieve_many(m: CaseMatrix, queries: List[Dict[str, float]], top_ks: List[int]):
+    """Varias consultas contra la misma matriz con un solo producto matriz-matriz."""
+    if not queries:
+        return []
+    Q = np.stack([m.query_vector(w) for w in queries])
+    scores = m.match_weights_many(Q) / m.totals
+    return [_winners(m, scores[j], w, k) for j, (w, k) in enumerate(zip(queries, top_ks))]
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from sqlalchemy import (
-    Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Text, DECIMAL,
+    Integer, BigInteger, String, Float, DateTime, Boolean, ForeignKey, JSON, Text, DECIMAL,
     func, text
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -45,6 +45,10 @@ class Case(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(), server_default=func.now(), nullable=False
     )
+    # lo consulta el refresco incremental del case base en memoria (app/casebase.py)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(), server_default=func.now(), onupdate=func.now(), nullable=False, index=True
+    )
 
     disease = relationship("Disease")
     symptom_weights = relationship("CaseSymptomWeight", cascade="all, delete-orphan")
@@ -66,9 +70,10 @@ class CaseSolution(Base):
 
 class Consult(Base):
     __tablename__ = "consults"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # id generado en el cliente (app/audit.py), no autoincremental
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, server_default=func.now(), nullable=False
+        DateTime, server_default=func.now(), nullable=False, index=True
     )
     top_k: Mapped[int] = mapped_column(Integer, nullable=False)
     query_weights: Mapped[dict] = mapped_column(JSON, nullable=False)
@@ -91,7 +96,7 @@ class ConsultResult(Base):
     __tablename__ = "consult_results"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     consult_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("consults.id", ondelete="CASCADE"), nullable=False, index=True
+        BigInteger, ForeignKey("consults.id", ondelete="CASCADE"), nullable=False, index=True
     )
     rank_pos: Mapped[int] = mapped_column(Integer, nullable=False)
     disease_code: Mapped[str] = mapped_column(
@@ -102,4 +107,18 @@ class ConsultResult(Base):
     missing: Mapped[dict] = mapped_column(JSON, nullable=False)   # {"codes": [...]}
     solutions: Mapped[dict] = mapped_column(JSON, nullable=False) # {"codes": [...], "names": [...]}
 
-    consult = relationship("Consult", back_populates="results")
\ No newline at end of file
+    consult = relationship("Consult", back_populates="results")
+
+class SchemaVersion(Base):
+    """Huella del esquema aplicado (app/startup.py): si coincide, el arranque no ejecuta DDL."""
+    __tablename__ = "schema_version"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+
+class WorkerLease(Base):
+    """worker_id (0 .. 2^ID_WORKER_BITS - 1) de los ids de consulta reservado por un proceso vivo (app/audit.py)."""
+    __tablename__ = "worker_leases"
+    worker_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    owner: Mapped[str] = mapped_column(String(64), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
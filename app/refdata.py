@@ -0,0 +1,141 @@
+"""Caché en proceso de los datos de referencia (categorías, síntomas, enfermedades, soluciones).
+
+Los cuerpos JSON se serializan una vez por versión y se sirven con ETag fuerte
+(hash del contenido, igual en todos los workers). La búsqueda `?q=` de síntomas
+usa un índice de trigramas en memoria en lugar de `LIKE '%q%'`.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+REFDATA_TTL_SECONDS = float(os.getenv("REFDATA_TTL_SECONDS", "300"))
+_SEARCH_CACHE_MAX = 256
+
+
+class Body:
+    __slots__ = ("content", "etag")
+
+    def __init__(self, payload):
+        self.content = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha1(self.content).hexdigest()[:20]
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SymptomIndex:
+    """Trigrama -> posiciones de síntomas; se confirma con `in` sobre el nombre en minúsculas."""
+
+    def __init__(self, symptoms: List[dict]):
+        self.symptoms = symptoms
+        self._names = [s["name"].lower() for s in symptoms]
+        self._postings: Dict[str, Set[int]] = {}
+        for i, name in enumerate(self._names):
+            for tg in _trigrams(name):
+                self._postings.setdefault(tg, set()).add(i)
+
+    def search(self, q: str) -> List[dict]:
+        q = q.lower()
+        if len(q) < 3:
+            candidates = range(len(self._names))
+        else:
+            # la lista más corta primero para que la intersección sea barata
+            lists = sorted((self._postings.get(tg, set()) for tg in _trigrams(q)), key=len)
+            candidates = sorted(set.intersection(*lists)) if lists[0] else []
+        return [self.symptoms[i] for i in candidates if q in self._names[i]]
+
+
+class RefData:
+    def __init__(self, ttl: float = REFDATA_TTL_SECONDS):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._bodies: Dict[str, Body] = {}
+        self._index: Optional[SymptomIndex] = None
+        self._search: "OrderedDict[str, Body]" = OrderedDict()
+        self.symptom_codes: Set[str] = set()
+        self.solution_names: Dict[str, str] = {}
+        self.disease_names: Dict[str, str] = {}
+
+    @property
+    def fresh(self) -> bool:
+        return self._loaded_at is not None and (self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl)
+
+    def ensure(self, db: Session) -> None:
+        """Carga (o recarga si venció el TTL) con la sesión síncrona de run_sync."""
+        if not self.fresh:
+            self.load(db)
+
+    def load(self, db: Session) -> None:
+        categories = [
+            {"code": code, "name": name}
+            for code, name in db.execute(select(models.SymptomCategory.code, models.SymptomCategory.name)).all()
+        ]
+        symptoms = [
+            {"code": code, "name": name, "category_code": cat}
+            for code, name, cat in db.execute(
+                select(models.Symptom.code, models.Symptom.name, models.Symptom.category_code)
+                .order_by(models.Symptom.code)
+            ).all()
+        ]
+        diseases = db.execute(select(models.Disease.code, models.Disease.name).order_by(models.Disease.code)).all()
+        solutions = db.execute(select(models.Solution.code, models.Solution.name).order_by(models.Solution.code)).all()
+
+        with self._lock:
+            self._bodies = {
+                "symptom-categories": Body(categories),
+                "symptoms": Body(symptoms),
+                "diseases": Body([{"code": c, "name": n} for c, n in diseases]),
+                "solutions": Body([{"code": c, "name": n} for c, n in solutions]),
+            }
+            self._index = SymptomIndex(symptoms)
+            self._search = OrderedDict()
+            self.symptom_codes = {s["code"] for s in symptoms}
+            self.disease_names = dict(diseases)
+            self.solution_names = dict(solutions)
+            self.version += 1
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Hook de cambio: la próxima petición recarga desde la DB."""
+        with self._lock:
+            self._loaded_at = None
+
+    def body(self, name: str) -> Body:
+        return self._bodies[name]
+
+    def search_symptoms(self, q: str) -> Body:
+        with self._lock:
+            hit = self._search.get(q)
+            if hit is not None:
+                self._search.move_to_end(q)
+                return hit
+            body = Body(self._index.search(q))
+            self._search[q] = body
+            if len(self._search) > _SEARCH_CACHE_MAX:
+                self._search.popitem(last=False)
+            return body
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # comparación débil (RFC 9110): ignora el prefijo W/
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in tags
+
+
+refdata = RefData()
@@ -1,11 +1,38 @@
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
 
 class DiagnoseRequest(BaseModel):
     symptoms: Optional[List[str]] = None
     weights: Optional[Dict[str, float]] = None
     top_k: int = Field(default=3, ge=1, le=20)
+    # coverage (peso_intersección / peso_total_del_caso) | weighted_jaccard | cosine | tversky
+    metric: Literal["coverage", "weighted_jaccard", "cosine", "tversky"] = "coverage"
+    alpha: float = Field(default=0.5, ge=0, le=1)  # tversky
+    beta: float = Field(default=1.0, ge=0)         # tversky
+    # approximate: candidatos por MinHash-LSH (app/ann.py), solo con metric=coverage y sin
+    # CASEBASE_SNAPSHOT_PATH; en otro caso (otra métrica, case base mapeado) se ejecuta el exacto
+    mode: Literal["exact", "approximate"] = "exact"
+    # una propuesta por enfermedad sobre los `neighbors` casos más parecidos
+    aggregate: Optional[Literal["max", "mean", "vote"]] = None
+    neighbors: int = Field(default=50, ge=1, le=1000)
+
+    def metric_params(self) -> dict:
+        return {"alpha": self.alpha, "beta": self.beta} if self.metric == "tversky" else {}
+
+    def retrieve_k(self) -> int:
+        """Casos a recuperar: top_k, o los vecinos a agregar (al menos top_k)."""
+        return max(self.neighbors, self.top_k) if self.aggregate else self.top_k
+
+    def cache_params(self) -> tuple:
+        return (self.metric, self.mode, self.aggregate, self.retrieve_k(), *self.metric_params().values())
+
+
+class SubscribeRequest(BaseModel):
+    """Consulta en vivo (app/subscriptions.py): ranking de casos por cobertura."""
+    symptoms: Optional[List[str]] = None
+    weights: Optional[Dict[str, float]] = None
+    top_k: int = Field(default=3, ge=1, le=20)
 
 
 class Proposal(BaseModel):
@@ -15,6 +42,8 @@ class Proposal(BaseModel):
     matched_symptoms: List[str]
     missing_from_query: List[str]
     solutions: List[str]
+    # vecinos de la enfermedad (solo con aggregate)
+    support: Optional[int] = None
 
 
 class DiagnoseResponse(BaseModel):
@@ -22,8 +51,30 @@ class DiagnoseResponse(BaseModel):
     proposals: List[Proposal]
 
 
+class DiagnoseBatchItem(BaseModel):
+    consult_id: Optional[int] = None
+    proposals: Optional[List[Proposal]] = None
+    error: Optional[str] = None
+
+
+class DiagnoseBatchResponse(BaseModel):
+    results: List[DiagnoseBatchItem]
+
+
 class RetainRequest(BaseModel):
     disease_code: str
     symptom_weights: Dict[str, float]
     solutions: List[str] = []
-    notes: Optional[str] = None
\ No newline at end of file
+    notes: Optional[str] = None
+
+
+class CaseUpdate(BaseModel):
+    is_active: bool
+
+
+class CompactRequest(BaseModel):
+    # Jaccard ponderado mínimo para considerar dos casos casi duplicados (1.0 = solo exactos);
+    # por defecto MAINTENANCE_THRESHOLD
+    threshold: Optional[float] = Field(default=None, gt=0, le=1)
+    # sin apply solo se informa
+    apply: bool = False
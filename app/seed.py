@@ -1,68 +1,84 @@
 # app/seed.py
+from sqlalchemy import insert, literal, select, union_all
 from sqlalchemy.orm import Session
 from .db import SessionLocal
 from . import models
 from .data import SYMPTOM_CATEGORIES, SYMPTOMS, SOLUTIONS, DISEASES, INITIAL_CASES
+from .refdata import refdata
+
+# tablas que se siembran, en orden de claves foráneas
+_SEEDED = (models.Disease, models.Solution, models.SymptomCategory, models.Symptom, models.Case)
+
+
+def _populated(db: Session) -> set:
+    """Nombres de las tablas sembradas que ya tienen filas, en una sola consulta."""
+    probes = [
+        select(literal(m.__tablename__).label("name")).where(select(literal(1)).select_from(m).exists())
+        for m in _SEEDED
+    ]
+    return set(db.execute(union_all(*probes)).scalars())
 
 
 def bootstrap_if_empty():
-    """Carga datos base de forma idempotente y en el orden correcto."""
+    """Carga datos base de forma idempotente y en el orden correcto: un INSERT por tabla vacía."""
     db: Session = SessionLocal()
     try:
+        populated = _populated(db)
+        if len(populated) == len(_SEEDED):
+            return
+
         # 1) Tablas maestras: Disease, Solution, SymptomCategory
-        if db.query(models.Disease).count() == 0:
-            db.add_all([models.Disease(code=k, name=v) for k, v in DISEASES.items()])
-        if db.query(models.Solution).count() == 0:
-            db.add_all([models.Solution(code=k, name=v) for k, v in SOLUTIONS.items()])
-        if db.query(models.SymptomCategory).count() == 0:
-            db.add_all(
-                [
-                    models.SymptomCategory(code=k, name=v)
-                    for k, v in SYMPTOM_CATEGORIES.items()
-                ]
+        if "diseases" not in populated:
+            db.execute(insert(models.Disease), [{"code": k, "name": v} for k, v in DISEASES.items()])
+        if "solutions" not in populated:
+            db.execute(insert(models.Solution), [{"code": k, "name": v} for k, v in SOLUTIONS.items()])
+        if "symptom_categories" not in populated:
+            db.execute(
+                insert(models.SymptomCategory),
+                [{"code": k, "name": v} for k, v in SYMPTOM_CATEGORIES.items()],
             )
-        db.commit()
 
         # 2) Symptoms (después de categories)
-        if db.query(models.Symptom).count() == 0:
+        if "symptoms" not in populated:
             # Asegúrate de que este código exista en SYMPTOM_CATEGORIES
             default_cat = "S3"
-            if not db.get(models.SymptomCategory, default_cat):
+            if "symptom_categories" in populated and not db.get(models.SymptomCategory, default_cat):
                 # si no existe, toma cualquier categoría disponible
                 any_cat = db.query(models.SymptomCategory.code).first()
                 default_cat = any_cat[0] if any_cat else None
+            elif "symptom_categories" not in populated and default_cat not in SYMPTOM_CATEGORIES:
+                default_cat = next(iter(SYMPTOM_CATEGORIES), None)
 
-            items = []
-            for code, name in SYMPTOMS.items():
-                items.append(
-                    models.Symptom(code=code, name=name, category_code=default_cat)
-                )
-            db.add_all(items)
-            db.commit()
-
-        # 3) Cases iniciales + pesos + soluciones demo
-        if db.query(models.Case).count() == 0:
-            for ic in INITIAL_CASES:
-                c = models.Case(disease_code=ic["disease_code"], notes=ic.get("notes"))
-                db.add(c)
-                db.flush()  # ya tenemos c.id
-
-                for sc, w in ic["symptom_weights"].items():
-                    db.add(
-                        models.CaseSymptomWeight(
-                            case_id=c.id, symptom_code=sc, weight=float(w)
-                        )
-                    )
+            db.execute(
+                insert(models.Symptom),
+                [{"code": code, "name": name, "category_code": default_cat} for code, name in SYMPTOMS.items()],
+            )
 
+        # 3) Cases iniciales + pesos + soluciones demo; la tabla está vacía, así que
+        #    los ids se asignan aquí y cada tabla va en un solo executemany
+        if "cases" not in populated:
+            cases, weights, solutions = [], [], []
+            for case_id, ic in enumerate(INITIAL_CASES, start=1):
+                cases.append({"id": case_id, "disease_code": ic["disease_code"], "notes": ic.get("notes")})
+                weights.extend(
+                    {"case_id": case_id, "symptom_code": sc, "weight": float(w)}
+                    for sc, w in ic["symptom_weights"].items()
+                )
                 demo = (
                     ["T03", "T10"]
                     if ic["disease_code"] != "P02"
                     else ["T02", "T03", "T09"]
                 )
-                for s in demo:
-                    db.add(models.CaseSolution(case_id=c.id, solution_code=s))
+                solutions.extend({"case_id": case_id, "solution_code": s} for s in demo)
+            if cases:
+                db.execute(insert(models.Case), cases)
+                db.execute(insert(models.CaseSymptomWeight), weights)
+                db.execute(insert(models.CaseSolution), solutions)
+
+        db.commit()
 
-            db.commit()
+        # los catálogos pudieron cambiar: la caché de referencia se recarga
+        refdata.invalidate()
 
     except Exception:
         db.rollback()
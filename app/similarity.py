@@ -0,0 +1,85 @@
+"""Registro de métricas de similitud sobre un kernel vectorizado común.
+
+El kernel (CaseMatrix.reductions) calcula, con una pasada por los nnz de la CSR,
+solo las reducciones que la métrica declara:
+
+    match  Σ c_i · [q_i > 0]     peso del caso en los síntomas consultados
+    dot    Σ c_i · q_i
+    min    Σ min(c_i, q_i)       intersección ponderada
+
+y cada métrica combina esas reducciones con las normas precalculadas del caso
+(`totals` = Σ c_i, `norms` = ‖c‖₂) y de la consulta. Añadir una métrica es
+añadir una función elementwise: no agrega pasadas sobre la matriz.
+
+NumPy se importa dentro de las funciones: este módulo se carga al arrancar
+(vía app/cbr.py) y el kernel solo hace falta en la primera consulta.
+"""
+from typing import TYPE_CHECKING, Callable, Dict, FrozenSet, NamedTuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_METRIC = "coverage"
+
+
+class Query(NamedTuple):
+    total: float  # Σ q_i
+    norm: float   # ‖q‖₂
+
+
+class Metric(NamedTuple):
+    name: str
+    needs: FrozenSet[str]
+    score: Callable[..., "np.ndarray"]
+
+
+REGISTRY: Dict[str, Metric] = {}
+
+
+def register(name: str, *needs: str):
+    def deco(fn):
+        REGISTRY[name] = Metric(name, frozenset(needs), fn)
+        return fn
+    return deco
+
+
+def _safe(x: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+
+    return np.where(x > 0, x, 1.0)
+
+
+@register("coverage", "match")
+def coverage(r, m, q: Query, **_):
+    # sim = peso_intersección / peso_total_del_caso (la métrica original)
+    return r["match"] / m.totals
+
+
+@register("weighted_jaccard", "min")
+def weighted_jaccard(r, m, q: Query, **_):
+    # Σ min / Σ max, con Σ max = Σ q + Σ c - Σ min
+    return r["min"] / _safe(q.total + m.totals - r["min"])
+
+
+@register("cosine", "dot")
+def cosine(r, m, q: Query, **_):
+    return r["dot"] / _safe(m.norms * q.norm)
+
+
+@register("tversky", "min")
+def tversky(r, m, q: Query, alpha: float = 0.5, beta: float = 1.0, **_):
+    # Tversky simétrico (Jimenez et al. 2013) sobre conjuntos ponderados
+    import numpy as np
+
+    common = r["min"]
+    a = np.maximum(q.total - common, 0.0)
+    b = np.maximum(m.totals - common, 0.0)
+    denom = common + beta * (alpha * np.minimum(a, b) + (1 - alpha) * np.maximum(a, b))
+    return common / _safe(denom)
+
+
+def get(name: str) -> Metric:
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Unknown metric: {name}") from None
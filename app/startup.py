@@ -0,0 +1,158 @@
+"""Arranque del worker: esquema, semilla, precarga en segundo plano y tiempos.
+
+- El DDL (`create_all`) solo se ejecuta si la huella del esquema guardada en
+  `schema_version` no coincide con la de app/models.py: un arranque normal es
+  una consulta en lugar de inspeccionar cada tabla.
+- STARTUP_MODE=eager (por defecto) carga case base y datos de referencia antes
+  de aceptar tráfico; STARTUP_MODE=lazy los carga en un hilo tras arrancar y
+  `/ready` responde 503 hasta que terminan (`/health` sigue siendo solo liveness).
+  Una consulta que llega antes espera a esa misma carga en vez de repetirla.
+- `timings` guarda la duración de cada fase; se publican en `/ready`, `/stats`
+  y `/metrics`, y `python -m bench.coldstart` mide el arranque desde fuera.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import models
+from .db import Base, ReadSessionLocal
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager").lower()
+SEED_ON_STARTUP = os.getenv("SEED_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+# espera antes de reintentar una precarga fallida de STARTUP_MODE=lazy; se dobla hasta el máximo
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "1"))
+WARMUP_RETRY_MAX_SECONDS = 60.0
+
+log = logging.getLogger("psych_cbr.startup")
+
+# fase -> segundos
+timings: Dict[str, float] = {}
+warmup: Optional[asyncio.Task] = None
+# intento de precarga en curso (las consultas esperan a este, no a los reintentos)
+_attempt: Optional[asyncio.Future] = None
+ready = False
+# si este arranque tuvo que ejecutar el DDL
+ddl_applied = False
+
+
+def mark(phase: str, t0: float) -> float:
+    """Anota la duración de una fase desde t0 y devuelve el instante actual."""
+    now = time.perf_counter()
+    timings[phase] = round(now - t0, 4)
+    return now
+
+
+def schema_fingerprint(metadata=Base.metadata) -> str:
+    """Hash de tablas, columnas, índices y claves foráneas declarados."""
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(f"T {table.name}")
+        for col in table.columns:
+            parts.append(f"C {col.name} {col.type} {col.nullable} {col.primary_key}")
+        for ix in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"I {ix.name} {','.join(c.name for c in ix.columns)} {ix.unique}")
+        for fk in sorted(table.foreign_keys, key=lambda f: f.target_fullname):
+            parts.append(f"F {fk.parent.name} {fk.target_fullname}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def ensure_schema(engine: Engine) -> bool:
+    """Ejecuta el DDL si la huella no coincide; devuelve True si lo ejecutó."""
+    expected = schema_fingerprint()
+    try:
+        with engine.connect() as conn:
+            current = conn.execute(
+                select(models.SchemaVersion.fingerprint).where(models.SchemaVersion.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        current = None  # sin tabla schema_version: base nueva o anterior a la huella
+    if current == expected:
+        return False
+    Base.metadata.create_all(bind=engine)
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(models.SchemaVersion))
+            conn.execute(insert(models.SchemaVersion).values(id=1, fingerprint=expected))
+    except SQLAlchemyError:
+        pass  # otro worker la escribió a la vez; el siguiente arranque la lee
+    return True
+
+
+def warm() -> None:
+    """Carga case base y datos de referencia (síncrono, con su propia sesión de la réplica).
+
+    Con CBR_ENGINE=matrix también construye la CSR, que si no se haría en la
+    primera consulta, con RETRIEVE_EXECUTOR=process arranca los procesos hijos y,
+    desde ANN_MIN_CASES casos, construye el índice LSH de mode=approximate.
+    """
+    from . import cbr
+    from .casebase import CASEBASE_SNAPSHOT_PATH, case_base
+    from .executor import executor
+    from .refdata import refdata
+
+    t0 = time.perf_counter()
+    with ReadSessionLocal() as db:
+        case_base.ensure_loaded(db)
+        t0 = mark("case_base", t0)
+        refdata.ensure(db)
+        t0 = mark("refdata", t0)
+    if cbr.ENGINE == "matrix":
+        from . import matrix
+
+        matrix.for_snapshot(case_base.snapshot())
+        t0 = mark("matrix", t0)
+    if executor.kind == "process":
+        executor.start()
+        t0 = mark("executor", t0)
+    if not CASEBASE_SNAPSHOT_PATH:
+        from . import ann
+
+        # si no, la primera consulta mode=approximate lo lanzaría en segundo plano
+        if ann.ANN_PREBUILD and len(case_base) >= ann.ANN_MIN_CASES:
+            ann.ensure_attached()
+            mark("ann", t0)
+
+
+def finish(t_start: float) -> None:
+    global ready
+    ready = True
+    timings["total"] = round(time.perf_counter() - t_start, 4)
+    log.info("startup (%s) %s", STARTUP_MODE, timings)
+
+
+async def _warm_in_background(t_start: float) -> None:
+    """Precarga hasta que salga bien; mientras tanto /ready sigue en 503."""
+    global _attempt
+    delay = WARMUP_RETRY_SECONDS
+    while True:
+        _attempt = asyncio.ensure_future(asyncio.to_thread(warm))
+        try:
+            await _attempt
+            break
+        except Exception:
+            log.exception("warmup failed; retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+    finish(t_start)
+
+
+def start_warmup(t_start: float) -> None:
+    global warmup
+    warmup = asyncio.get_event_loop().create_task(_warm_in_background(t_start))
+
+
+async def wait_warm() -> None:
+    """Si hay un intento de precarga en curso, espera a que termine (sin cancelarlo ni propagar su error).
+
+    Si falla, la consulta carga por el camino normal en lugar de esperar al siguiente reintento.
+    """
+    attempt = _attempt
+    if attempt is not None and not attempt.done():
+        await asyncio.wait([attempt])
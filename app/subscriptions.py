@@ -0,0 +1,221 @@
+"""Consultas en vivo: el servidor empuja cambios de ranking en lugar de re-ejecutar /v1/diagnose.
+
+Un cliente registra una consulta (síntomas/pesos y top_k) por WebSocket o SSE
+y recibe primero su ranking completo de casos (`type: snapshot`, un retrieve
+normal). Después, el registro está enganchado al case base como un índice más
+(CaseBase.attach): cada caso que entra (retain, importación, refresco desde
+otros workers) se puntúa con cbr.compare solo contra las consultas que comparten
+algún síntoma con él (listas invertidas síntoma -> suscripciones), y si entra en
+el top_k de alguna se le envía `type: delta` con el caso, su posición y el caso
+que sale. Coste por caso nuevo: O(suscripciones afectadas), sin recorrer el case base.
+
+Si sale del case base un caso que estaba en un ranking (desactivación,
+compactación, recarga) esa suscripción recibe un snapshot nuevo. Con
+CASEBASE_SNAPSHOT_PATH, el case base mapeado pasa al registro la diferencia de
+cada generación nueva, sea de este worker o de otro; mientras haya suscriptores
+se comprueba cada SUBSCRIPTION_POLL_SECONDS (un stat del archivo).
+"""
+import asyncio
+import itertools
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import cbr
+from .casebase import CASEBASE_SNAPSHOT_PATH, CaseRecord, case_base
+
+# mensajes pendientes por suscriptor; si se llena, se le reenvía un snapshot
+SUBSCRIPTION_QUEUE_MAX = int(os.getenv("SUBSCRIPTION_QUEUE_MAX", "100"))
+# máximo de suscripciones por worker (503 / cierre 1013 al superarlo)
+SUBSCRIPTIONS_MAX = int(os.getenv("SUBSCRIPTIONS_MAX", "1000"))
+# comentario SSE / ping para que nginx no corte conexiones inactivas (proxy_read_timeout)
+SUBSCRIPTION_HEARTBEAT_SECONDS = float(os.getenv("SUBSCRIPTION_HEARTBEAT_SECONDS", "25"))
+# con CASEBASE_SNAPSHOT_PATH: cada cuánto se mira si otro worker publicó una generación
+SUBSCRIPTION_POLL_SECONDS = float(os.getenv("SUBSCRIPTION_POLL_SECONDS", "1"))
+
+_ids = itertools.count(1)
+
+
+def _entry(case: CaseRecord, sim: float, det: dict) -> dict:
+    """Mismo formato que una propuesta de /v1/diagnose, con el id del caso."""
+    return {"case_id": case.id, **cbr.reuse([(case, sim, det)], top_k=1)[0]}
+
+
+class Subscription:
+    """Consulta registrada, su top_k actual [(caso, similitud)] y la cola hacia el cliente."""
+
+    def __init__(self, weights: Dict[str, float], top_k: int, loop: asyncio.AbstractEventLoop):
+        self.id = next(_ids)
+        self.weights = weights
+        self.top_k = top_k
+        self.ranking: List[Tuple[CaseRecord, float]] = []
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_MAX)
+        # el ranking dejó de ser fiable (o se perdieron mensajes): hay que reenviar snapshot
+        self.stale = True
+        # casos llegados mientras estaba stale: pueden no estar en el snapshot del resync
+        self.backlog: List[CaseRecord] = []
+
+    def _push(self, message: Optional[dict]) -> None:
+        """Encola desde el event loop; None = solo despertar al emisor para que resincronice."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            with registry._lock:
+                self.stale = True
+
+    def notify(self, message: Optional[dict]) -> None:
+        """Seguro desde cualquier hilo (los listeners del case base corren donde se escribe)."""
+        self.loop.call_soon_threadsafe(self._push, message)
+
+    def offer(self, case: CaseRecord) -> Optional[dict]:
+        """Puntúa un caso nuevo; devuelve el delta si entra en el top_k (con el lock del registro)."""
+        sim, det = cbr.compare(case, self.weights)
+        if sim <= 0:
+            return None
+        ranking = self.ranking
+        # empate con el k-ésimo: gana el caso más antiguo, como en el retrieve completo
+        if len(ranking) >= self.top_k and sim <= ranking[-1][1]:
+            return None
+        if any(c.id == case.id for c, _ in ranking):
+            return None
+        rank = next((i for i, (_, s) in enumerate(ranking) if sim > s), len(ranking))
+        ranking.insert(rank, (case, sim))
+        evicted = ranking.pop() if len(ranking) > self.top_k else None
+        return {
+            "type": "delta",
+            "subscription": self.id,
+            "rank": rank + 1,
+            "entered": _entry(case, sim, det),
+            "evicted": {"case_id": evicted[0].id, "similarity": round(evicted[1], 3)} if evicted else None,
+        }
+
+    def resync(self) -> dict:
+        """Ranking completo desde el snapshot actual (un retrieve normal)."""
+        snap = case_base.snapshot()
+        retr = cbr.search(snap, self.weights, self.top_k)
+        with registry._lock:
+            self.ranking = [(c, sim) for c, sim, _ in retr if sim > 0]
+            # lo que llegó entre el snapshot y ahora (ofrecer lo ya incluido no cambia nada)
+            for record in self.backlog:
+                self.offer(record)
+            self.backlog = []
+            self.stale = False
+            ranking = list(self.ranking)
+        return {
+            "type": "snapshot",
+            "subscription": self.id,
+            "version": snap.version,
+            "ranking": [_entry(c, sim, cbr.compare(c, self.weights)[1]) for c, sim in ranking],
+        }
+
+
+class SubscriptionRegistry:
+    """Índice del case base (reset/add/discard) que reparte los casos nuevos a las suscripciones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict[int, Subscription] = {}
+        # síntoma -> suscripciones que lo consultan con peso > 0
+        self._by_symptom: Dict[str, Set[int]] = {}
+        # aparte de _lock: attach toma el lock del case base, que a su vez llama a reset/add
+        self._attach_lock = threading.Lock()
+        self._attached = False
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def register(self, sub: Subscription) -> None:
+        if not self._attached:
+            with self._attach_lock:
+                if not self._attached:
+                    case_base.attach(self)
+                    self._attached = True
+        with self._lock:
+            self._subs[sub.id] = sub
+            for code, w in sub.weights.items():
+                if w > 0:
+                    self._by_symptom.setdefault(code, set()).add(sub.id)
+
+    def unregister(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.pop(sub.id, None)
+            for code in sub.weights:
+                ids = self._by_symptom.get(code)
+                if ids is not None:
+                    ids.discard(sub.id)
+                    if not ids:
+                        del self._by_symptom[code]
+
+    # --- interfaz de índice del case base (se llama con el lock del case base tomado) ---
+
+    def reset(self, records) -> None:
+        # recarga completa: cada suscripción recalcula su ranking
+        with self._lock:
+            subs = list(self._subs.values())
+        for sub in subs:
+            sub.stale = True
+            sub.notify(None)
+
+    def add(self, record: CaseRecord) -> None:
+        with self._lock:
+            if not self._subs:
+                return
+            affected: Set[int] = set()
+            for code in record.weights:
+                affected |= self._by_symptom.get(code, set())
+            deltas = []
+            for sub in (self._subs[i] for i in affected):
+                if sub.stale:
+                    sub.backlog.append(record)
+                else:
+                    deltas.append((sub, sub.offer(record)))
+        for sub, delta in deltas:
+            if delta is not None:
+                sub.notify(delta)
+
+    def discard(self, case_id: int) -> None:
+        with self._lock:
+            hit = [s for s in self._subs.values() if any(c.id == case_id for c, _ in s.ranking)]
+            for sub in hit:
+                sub.stale = True
+            for sub in self._subs.values():
+                if sub.backlog:
+                    sub.backlog = [r for r in sub.backlog if r.id != case_id]
+        for sub in hit:
+            sub.notify(None)
+
+
+registry = SubscriptionRegistry()
+
+
+async def messages(sub: Subscription):
+    """Mensajes para el cliente: snapshot inicial, deltas y snapshots de resincronización.
+
+    Produce None cada SUBSCRIPTION_HEARTBEAT_SECONDS sin mensajes (para el ping).
+    """
+    poll = SUBSCRIPTION_HEARTBEAT_SECONDS
+    if CASEBASE_SNAPSHOT_PATH:
+        poll = min(poll, SUBSCRIPTION_POLL_SECONDS)
+    idle = 0.0
+    while True:
+        if sub.stale:
+            # el retrieve completo va fuera del event loop; se descarta lo encolado antes
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            yield await asyncio.to_thread(sub.resync)
+            continue
+        try:
+            message = await asyncio.wait_for(sub.queue.get(), poll)
+        except asyncio.TimeoutError:
+            if CASEBASE_SNAPSHOT_PATH:
+                # remapea si otro worker publicó; los cambios llegan a la cola por _sync
+                await asyncio.to_thread(case_base.snapshot)
+            idle += poll
+            if idle >= SUBSCRIPTION_HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield None
+            continue
+        idle = 0.0
+        if message is not None and not sub.stale:
+            yield message
@@ -0,0 +1,247 @@
+"""Instrumentación del camino caliente: spans por etapa, SQL por request y /metrics.
+
+Cada request lleva un `Trace` en una ContextVar (lo crea `TelemetryMiddleware`).
+`span("etapa")` mide una etapa del handler; los eventos de SQLAlchemy cuentan
+consultas y su duración contra el Trace activo. Al cerrar la request todo se
+acumula en histogramas con buckets fijos que `/metrics` exporta en formato de
+texto de Prometheus. Fuera de una request `span()` no hace nada.
+
+Con SERVER_TIMING=true se añade la cabecera `Server-Timing` a cada respuesta.
+"""
+import bisect
+import contextlib
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+# con TELEMETRY=false no se crea el Trace ni se acumula nada (el endpoint sigue existiendo)
+TELEMETRY = os.getenv("TELEMETRY", "true").lower() in ("1", "true", "yes")
+
+# segundos; pensados para latencias de 0,1 ms a varios segundos
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Trace:
+    __slots__ = ("spans", "sql_count", "sql_seconds")
+
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("cbr_trace", default=None)
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Acumula en el Trace activo el tiempo del bloque bajo `name`."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans[name] = trace.spans.get(name, 0.0) + time.perf_counter() - t0
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "n")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.n += 1
+
+
+class Registry:
+    """Contadores e histogramas por etiqueta; un lock corto por request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[str, Histogram] = {}
+        self.stages: Dict[Tuple[str, str], Histogram] = {}
+        self.sql_queries: Dict[str, int] = {}
+        self.sql_seconds: Dict[str, float] = {}
+
+    def record(self, route: str, method: str, status: int, elapsed: float, trace: Trace) -> None:
+        with self._lock:
+            k = (route, method, status)
+            self.requests[k] = self.requests.get(k, 0) + 1
+            self.latency.setdefault(route, Histogram()).observe(elapsed)
+            for stage, seconds in trace.spans.items():
+                self.stages.setdefault((route, stage), Histogram()).observe(seconds)
+            if trace.sql_count:
+                self.sql_queries[route] = self.sql_queries.get(route, 0) + trace.sql_count
+                self.sql_seconds[route] = self.sql_seconds.get(route, 0.0) + trace.sql_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self.requests.clear(); self.latency.clear(); self.stages.clear()
+            self.sql_queries.clear(); self.sql_seconds.clear()
+
+
+registry = Registry()
+
+
+# --- SQL ---------------------------------------------------------------------
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _trace.get() is not None:
+        conn.info.setdefault("cbr_t0", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _trace.get()
+    stack = conn.info.get("cbr_t0")
+    if trace is None or not stack:
+        return
+    trace.sql_count += 1
+    trace.sql_seconds += time.perf_counter() - stack.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Engancha los eventos de cursor (para el async_engine, pasar su .sync_engine)."""
+    if not event.contains(engine, "before_cursor_execute", _before_execute):
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def pool_stats(engine: Engine) -> Dict[str, int]:
+    """Conexiones del pool; los pools de SQLite no exponen todos los contadores."""
+    pool = engine.pool
+    out = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                out[name] = int(fn())
+            except (TypeError, AttributeError):
+                pass
+    return out
+
+
+# --- ASGI ----------------------------------------------------------------------
+
+def _route(scope) -> str:
+    # plantilla de la ruta (/v1/cases/{case_id}), no el path: cardinalidad acotada
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return "unmatched"
+
+
+def server_timing(trace: Trace, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.spans.items()]
+    if trace.sql_count:
+        parts.append(f'sql;dur={trace.sql_seconds * 1000:.2f};desc="{trace.sql_count} queries"')
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class TelemetryMiddleware:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware): abre el Trace y registra al terminar."""
+
+    def __init__(self, app, exclude: Tuple[str, ...] = ()):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if not TELEMETRY or scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _trace.set(trace)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(trace, time.perf_counter() - t0).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            registry.record(_route(scope), scope["method"], status, time.perf_counter() - t0, trace)
+
+
+# --- exposición ----------------------------------------------------------------
+
+def _labels(**kv) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in kv.items()) + "}"
+
+
+def _histogram(lines: List[str], name: str, labels: dict, h: Histogram) -> None:
+    acc = 0
+    for bound, count in zip(BUCKETS, h.counts):
+        acc += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=repr(bound))} {acc}")
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {h.n}')
+    lines.append(f"{name}_sum{_labels(**labels)} {h.total:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {h.n}")
+
+
+def render(engines: Dict[str, Engine], gauges: Dict[str, float], counters: Optional[Dict[str, float]] = None) -> str:
+    """Texto de Prometheus (0.0.4) con lo acumulado más pool, gauges y contadores (`*_total`) de la app."""
+    r = registry
+    lines: List[str] = []
+    with r._lock:
+        lines += ["# HELP cbr_http_requests_total Requests HTTP por ruta, método y estado.",
+                  "# TYPE cbr_http_requests_total counter"]
+        for (route, method, status), n in sorted(r.requests.items()):
+            lines.append(f"cbr_http_requests_total{_labels(route=route, method=method, status=status)} {n}")
+
+        lines += ["# HELP cbr_http_request_duration_seconds Latencia total por ruta.",
+                  "# TYPE cbr_http_request_duration_seconds histogram"]
+        for route, h in sorted(r.latency.items()):
+            _histogram(lines, "cbr_http_request_duration_seconds", {"route": route}, h)
+
+        lines += ["# HELP cbr_stage_duration_seconds Duración de cada etapa del handler.",
+                  "# TYPE cbr_stage_duration_seconds histogram"]
+        for (route, stage), h in sorted(r.stages.items()):
+            _histogram(lines, "cbr_stage_duration_seconds", {"route": route, "stage": stage}, h)
+
+        lines += ["# HELP cbr_sql_queries_total Consultas SQL ejecutadas dentro de requests.",
+                  "# TYPE cbr_sql_queries_total counter"]
+        for route, n in sorted(r.sql_queries.items()):
+            lines.append(f"cbr_sql_queries_total{_labels(route=route)} {n}")
+        lines += ["# HELP cbr_sql_duration_seconds_total Tiempo en SQL dentro de requests.",
+                  "# TYPE cbr_sql_duration_seconds_total counter"]
+        for route, s in sorted(r.sql_seconds.items()):
+            lines.append(f"cbr_sql_duration_seconds_total{_labels(route=route)} {s:.6f}")
+
+    lines += ["# HELP cbr_db_pool_connections Conexiones del pool por estado.",
+              "# TYPE cbr_db_pool_connections gauge"]
+    for engine_name, eng in engines.items():
+        for state, n in pool_stats(eng).items():
+            lines.append(f"cbr_db_pool_connections{_labels(engine=engine_name, state=state)} {n}")
+
+    for name, value in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    for name, value in (counters or {}).items():
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,67 @@
+"""Benchmarks de retrieve/reuse con pytest-benchmark.
+
+No se recogen en la ejecución normal de pytest; se lanzan a mano:
+
+    pytest bench/bench_cbr.py --benchmark-json=bench/results/micro.json
+    BENCH_SIZES=1000,100000,1000000 pytest bench/bench_cbr.py
+"""
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app import cbr  # noqa: E402
+from app.casebase import Snapshot  # noqa: E402
+
+from .micro import build_engine  # noqa: E402
+from .synth import CaseGenerator  # noqa: E402
+
+SIZES = [int(x) for x in os.getenv("BENCH_SIZES", "1000,10000,100000").split(",")]
+MAX_PYTHON = int(os.getenv("BENCH_MAX_PYTHON", "100000"))
+TOP_K = 5
+
+_gen = CaseGenerator(seed=0)
+_queries = _gen.queries(64)
+_snapshots = {}
+
+
+def _snapshot(n: int) -> Snapshot:
+    if n not in _snapshots:
+        _snapshots[n] = Snapshot(1, tuple(_gen.records(n)))
+    return _snapshots[n]
+
+
+def _cycle(fn):
+    state = {"i": 0}
+
+    def call():
+        q = _queries[state["i"] % len(_queries)]
+        state["i"] += 1
+        return fn(q)
+    return call
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("engine", ["python", "matrix", "index"])
+def test_retrieve(benchmark, engine, n):
+    if engine == "python" and n > MAX_PYTHON:
+        pytest.skip("motor python demasiado lento a este tamaño")
+    retrieve = build_engine(engine, _snapshot(n))
+    benchmark.group = f"retrieve-{n}"
+    result = benchmark(_cycle(lambda q: retrieve(q, TOP_K)))
+    assert len(result) == min(TOP_K, n)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_reuse(benchmark, n):
+    retrieve = build_engine("matrix", _snapshot(n))
+    retrievals = [retrieve(q, TOP_K) for q in _queries]
+    benchmark.group = f"reuse-{n}"
+    state = {"i": 0}
+
+    def call():
+        state["i"] += 1
+        return cbr.reuse(retrievals[state["i"] % len(retrievals)], top_k=TOP_K)
+
+    assert len(benchmark(call)) == min(TOP_K, n)
@@ -0,0 +1,93 @@
+"""Tiempo de arranque en frío de un worker: proceso lanzado -> /health 200 -> /ready 200.
+
+    python -m bench.coldstart --cases 100000 --runs 5 --modes eager,lazy
+
+Cada arranque es un uvicorn nuevo sobre la misma SQLite ya poblada
+(bench.e2e.prepare_database). El primero de cada modo suele ejecutar el DDL
+(la base no tenía huella de esquema); la tabla separa ese arranque del resto e
+incluye las fases que el propio worker reporta en /ready (app/startup.py).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+from .e2e import prepare_database
+from .loadtest import _free_port
+
+_POLL_S = 0.01
+
+
+def _wait(url: str, proc: subprocess.Popen, deadline: float) -> Optional[httpx.Response]:
+    while time.time() < deadline and proc.poll() is None:
+        try:
+            r = httpx.get(url, timeout=1)
+            if r.status_code == 200:
+                return r
+        except httpx.HTTPError:
+            pass
+        time.sleep(_POLL_S)
+    return None
+
+
+def boot(database_url: str, mode: str, timeout: float = 120) -> dict:
+    """Arranca un worker, mide hasta /health y /ready y lo para."""
+    port = _free_port()
+    env = {"DATABASE_URL": database_url, "API_PREFIX": "", "STARTUP_MODE": mode,
+           "CASEBASE_REFRESH_SECONDS": "0", "SEED_ON_STARTUP": "true"}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        deadline = time.time() + timeout
+        if _wait(f"{base}/health", proc, deadline) is None:
+            raise RuntimeError("uvicorn no arrancó")
+        health_s = time.perf_counter() - t0
+        r = _wait(f"{base}/ready", proc, deadline)
+        if r is None:
+            raise RuntimeError("el worker no llegó a ready")
+        ready_s = time.perf_counter() - t0
+        report = r.json()
+        return {"mode": mode, "health_s": round(health_s, 3), "ready_s": round(ready_s, 3),
+                "ddl_applied": report["ddl_applied"], "phases": report["startup_s"]}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def run(n_cases: int, runs: int, modes: List[str]) -> List[dict]:
+    url = prepare_database(n_cases)
+    rows = []
+    for mode in modes:
+        boots = [boot(url, mode) for _ in range(runs)]
+        rows.extend(boots)
+        warm = [b for b in boots if not b["ddl_applied"]] or boots
+        first = boots[0]
+        print(f"{mode:<6} {n_cases:>8} casos  1er arranque (ddl={first['ddl_applied']}): "
+              f"health={first['health_s']:.2f}s ready={first['ready_s']:.2f}s")
+        print(f"{mode:<6} {n_cases:>8} casos  mediana de {len(warm)}: "
+              f"health={statistics.median(b['health_s'] for b in warm):.2f}s "
+              f"ready={statistics.median(b['ready_s'] for b in warm):.2f}s  fases={warm[-1]['phases']}")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", type=int, default=10000)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--modes", default="eager,lazy")
+    args = ap.parse_args(argv)
+    run(args.cases, args.runs, args.modes.split(","))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Escenario end-to-end: case base sintético importado a SQLite y carga HTTP sobre /v1/diagnose.
+
+    python -m bench.e2e --cases 100000 --concurrency 1,8,32 --duration 10
+
+La base se prepara en un subproceso (create_all + semilla + app.importer) para
+que el servidor arranque con el case base ya poblado; el pico de RSS se lee de
+/proc (VmHWM del proceso uvicorn y sus hijos).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from . import loadtest
+from .synth import CaseGenerator
+
+_PREPARE = """
+from app import models  # noqa: F401  (registra las tablas)
+from app.db import Base, engine
+from app.seed import bootstrap_if_empty
+from app.importer import import_file
+import json, sys
+Base.metadata.create_all(bind=engine)
+bootstrap_if_empty()
+print(json.dumps(import_file(sys.argv[1], chunk_size=5000)))
+"""
+
+
+def prepare_database(n_cases: int, seed: int = 0) -> str:
+    """SQLite temporal con la semilla más n_cases sintéticos; devuelve la DATABASE_URL."""
+    tmp = tempfile.mkdtemp(prefix="psych-cbr-e2e-")
+    url = f"sqlite:///{os.path.join(tmp, 'e2e.db')}"
+    jsonl = os.path.join(tmp, "cases.jsonl")
+    with open(jsonl, "w", encoding="utf-8") as fh:
+        for d in CaseGenerator(seed).case_dicts(n_cases):
+            fh.write(json.dumps(d) + "\n")
+    out = subprocess.run(
+        [sys.executable, "-c", _PREPARE, jsonl],
+        env={**os.environ, "DATABASE_URL": url}, check=True, capture_output=True, text=True,
+    )
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+    if report["failed"]:
+        raise RuntimeError(f"importación con errores: {report['errors'][:3]}")
+    return url
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fh:
+            return [int(x) for x in fh.read().split()]
+    except OSError:
+        return []
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM del proceso y sus hijos (solo Linux); None si no hay /proc."""
+    total, found = 0, False
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        stack.extend(_children(p))
+        try:
+            with open(f"/proc/{p}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+                        found = True
+        except OSError:
+            continue
+    return round(total / 1024, 1) if found else None
+
+
+def run(n_cases: int, levels: List[int], duration: float, seed: int = 0, env: dict | None = None) -> dict:
+    t0 = time.perf_counter()
+    url = prepare_database(n_cases, seed)
+    prepare_s = time.perf_counter() - t0
+    queries = CaseGenerator(seed).queries(256)
+
+    t0 = time.perf_counter()
+    with loadtest.local_server(workers=1, env=env, database_url=url) as (base, proc):
+        startup_s = time.perf_counter() - t0
+        rows = asyncio.run(loadtest.run(base, "diagnose", levels, duration, queries))
+        rss = peak_rss_mb(proc.pid)
+    return {
+        "cases": n_cases,
+        "prepare_s": round(prepare_s, 2),
+        "startup_s": round(startup_s, 2),
+        "server_peak_rss_mb": rss,
+        "levels": rows,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", type=int, default=10_000)
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--duration", type=float, default=5.0)
+    ap.add_argument("--engine", help="CBR_ENGINE del servidor (python|matrix|index)")
+    args = ap.parse_args(argv)
+    env = {"CBR_ENGINE": args.engine} if args.engine else None
+    result = run(args.cases, [int(x) for x in args.concurrency.split(",")], args.duration, env=env)
+    print(f"preparación {result['prepare_s']}s  arranque {result['startup_s']}s  "
+          f"RSS pico servidor {result['server_peak_rss_mb']}MB")
+
+
+if __name__ == "__main__":
+    main()
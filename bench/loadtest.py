@@ -0,0 +1,158 @@
+"""Prueba de carga HTTP: throughput y latencia por nivel de concurrencia en un worker.
+
+Sin --url levanta `uvicorn app.main:app --workers 1` sobre una SQLite temporal
+sembrada con los datos de app/data.py.
+
+    python -m bench.loadtest --concurrency 1,4,16,64 --duration 10
+    python -m bench.loadtest --url http://127.0.0.1:8000 --endpoint cases
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from app.data import SYMPTOMS
+
+ENDPOINTS = {
+    "diagnose": ("POST", "/v1/diagnose"),
+    "cases": ("GET", "/v1/cases"),
+    "symptoms": ("GET", "/v1/symptoms"),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_server(workers: int = 1, env: dict | None = None, database_url: str | None = None):
+    """uvicorn en un puerto libre sobre SQLite temporal; devuelve (URL base, proceso)."""
+    if database_url is None:
+        tmp = tempfile.mkdtemp(prefix="psych-cbr-bench-")
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    port = _free_port()
+    proc_env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "SEED_ON_STARTUP": "true",
+        "API_PREFIX": "",
+        **(env or {}),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=proc_env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError("uvicorn no arrancó")
+            time.sleep(0.2)
+        yield url, proc
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _diagnose_body(rng: random.Random) -> dict:
+    return {"symptoms": rng.sample(list(SYMPTOMS), rng.randint(3, 8)), "top_k": 5}
+
+
+async def run_level(url: str, endpoint: str, concurrency: int, duration: float, queries: List[dict] | None = None) -> dict:
+    method, path = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user(seed: int):
+            nonlocal errors
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    if method == "POST":
+                        body = {"weights": rng.choice(queries), "top_k": 5} if queries else _diagnose_body(rng)
+                        r = await client.post(path, json=body)
+                    else:
+                        r = await client.get(path)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - t0)
+                if not ok:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    return summarize(latencies, elapsed, concurrency=concurrency, errors=errors)
+
+
+def summarize(latencies: List[float], elapsed: float, **extra) -> dict:
+    lat = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return lat[min(len(lat) - 1, int(p * len(lat)))] * 1000 if lat else 0.0
+
+    return {
+        **extra,
+        "requests": len(lat),
+        "rps": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "mean_ms": round(statistics.fmean(lat) * 1000, 2) if lat else 0.0,
+    }
+
+
+async def run(url: str, endpoint: str, levels: List[int], duration: float, queries: List[dict] | None = None) -> List[dict]:
+    rows = []
+    for c in levels:
+        row = await run_level(url, endpoint, c, duration, queries)
+        rows.append(row)
+        print(f"c={c:<4} {row['rps']:>9.1f} req/s  p50={row['p50_ms']:.1f}ms "
+              f"p95={row['p95_ms']:.1f}ms p99={row['p99_ms']:.1f}ms errors={row['errors']}")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="servidor ya levantado (sin él se arranca uno local)")
+    ap.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="diagnose")
+    ap.add_argument("--concurrency", default="1,2,4,8,16,32")
+    ap.add_argument("--duration", type=float, default=5.0)
+    args = ap.parse_args(argv)
+    levels = [int(x) for x in args.concurrency.split(",")]
+
+    if args.url:
+        asyncio.run(run(args.url.rstrip("/"), args.endpoint, levels, args.duration))
+    else:
+        with local_server(workers=1) as (url, _):
+            asyncio.run(run(url, args.endpoint, levels, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Micro-benchmark de las métricas de similitud sobre el kernel vectorizado.
+
+    python -m bench.metrics --sizes 1000,10000,100000 --queries 200
+"""
+import argparse
+import time
+from typing import List
+
+from app import matrix, similarity
+
+from .synth import CaseGenerator
+
+
+def bench(sizes: List[int], n_queries: int, top_k: int = 5) -> List[dict]:
+    rows = []
+    gen = CaseGenerator(seed=0)
+    queries = gen.queries(n_queries, weighted=True)
+    for n in sizes:
+        m = matrix.CaseMatrix(1, gen.records(n))
+        for name in similarity.REGISTRY:
+            matrix.retrieve(m, queries[0], top_k, name)  # calentamiento
+            t0 = time.perf_counter()
+            for q in queries:
+                matrix.retrieve(m, q, top_k, name)
+            elapsed = time.perf_counter() - t0
+            rows.append({
+                "cases": n,
+                "metric": name,
+                "qps": round(n_queries / elapsed, 1),
+                "mean_ms": round(elapsed / n_queries * 1000, 3),
+            })
+            print(f"{n:>8} casos  {name:<17} {rows[-1]['qps']:>10.1f} q/s  {rows[-1]['mean_ms']:>8.3f} ms")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    args = ap.parse_args(argv)
+    bench([int(x) for x in args.sizes.split(",")], args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Micro-benchmarks de retrieve/reuse por motor y tamaño de case base.
+
+    python -m bench.micro --sizes 1000,10000,100000,1000000 --queries 200
+
+El motor `python` recorre todos los casos en Python y se omite por encima de
+--max-python casos. Ver también bench/bench_cbr.py (pytest-benchmark).
+"""
+import argparse
+import resource
+import sys
+import time
+from typing import Callable, Dict, List
+
+from app import cbr, matrix
+from app.casebase import Snapshot
+
+from .synth import CaseGenerator
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB, macOS bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def build_engine(name: str, snap: Snapshot) -> Callable[[Dict[str, float], int], list]:
+    """Devuelve retrieve(query, top_k) ya preparado (matriz/índice construidos)."""
+    if name == "python":
+        return lambda q, k: cbr.retrieve(snap.records, q)[:k]
+    if name == "matrix":
+        m = matrix.CaseMatrix(snap.version, snap.records)
+        return lambda q, k: matrix.retrieve(m, q, k)
+    if name == "index":
+        ix = cbr.InvertedIndex()
+        ix.reset(snap.records)
+        return lambda q, k: ix.retrieve(snap, q, k)
+    raise ValueError(name)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(s[min(len(s) - 1, int(p * len(s)))] * 1000, 4) if s else 0.0
+
+    return {"p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+def run(sizes: List[int], engines: List[str], n_queries: int = 200, top_k: int = 5,
+        max_python: int = 100_000, seed: int = 0) -> List[dict]:
+    gen = CaseGenerator(seed)
+    queries = gen.queries(n_queries)
+    rows = []
+    for n in sizes:
+        snap = Snapshot(1, tuple(gen.records(n)))
+        for name in engines:
+            if name == "python" and n > max_python:
+                continue
+            t0 = time.perf_counter()
+            retrieve = build_engine(name, snap)
+            build_ms = (time.perf_counter() - t0) * 1000
+
+            retrieve(queries[0], top_k)  # calentamiento
+            r_lat, u_lat = [], []
+            t_all = time.perf_counter()
+            for q in queries:
+                t0 = time.perf_counter()
+                retr = retrieve(q, top_k)
+                t1 = time.perf_counter()
+                cbr.reuse(retr, top_k=top_k)
+                r_lat.append(t1 - t0)
+                u_lat.append(time.perf_counter() - t1)
+            elapsed = time.perf_counter() - t_all
+
+            row = {
+                "cases": n,
+                "engine": name,
+                "build_ms": round(build_ms, 1),
+                "qps": round(n_queries / elapsed, 1),
+                "retrieve": percentiles(r_lat),
+                "reuse": percentiles(u_lat),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            rows.append(row)
+            print(f"{n:>8} casos  {name:<7} {row['qps']:>9.1f} q/s  retrieve p50={row['retrieve']['p50_ms']:.3f}ms "
+                  f"p99={row['retrieve']['p99_ms']:.3f}ms  build={row['build_ms']:.0f}ms  rss={row['peak_rss_mb']}MB")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--engines", default="python,matrix,index")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--max-python", type=int, default=100_000)
+    args = ap.parse_args(argv)
+    run([int(x) for x in args.sizes.split(",")], args.engines.split(","), args.queries, args.top_k, args.max_python)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Presupuesto de consultas SQL por endpoint, para que no vuelvan los N+1.
+
+Levanta la app en proceso sobre una SQLite temporal con la semilla más casos
+sintéticos, calienta las cachés y cuenta las consultas de cada request con los
+contadores de app/telemetry.py. Sale con código 1 si alguna ruta se pasa.
+
+    python -m bench.querycount
+    python -m pytest tests/test_querycount.py   # los mismos presupuestos como test
+"""
+import json
+import os
+import sys
+import tempfile
+from typing import Tuple
+
+_tmp = tempfile.mkdtemp(prefix="psych-cbr-qc-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'qc.db')}"
+os.environ["SEED_ON_STARTUP"] = "true"
+os.environ["API_PREFIX"] = ""
+os.environ["TELEMETRY"] = "true"
+os.environ["AUDIT_ASYNC"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import telemetry  # noqa: E402
+from app.casebase import case_base  # noqa: E402
+from app.main import app  # noqa: E402
+
+from .synth import CaseGenerator  # noqa: E402
+
+# (método, ruta, cuerpo, máximo de consultas con cachés calientes);
+# diagnose solo escribe la auditoría (consults + consult_results), en línea aquí
+BUDGETS = [
+    ("GET", "/v1/cases", None, 3),
+    ("GET", "/v1/cases?disease_code=P01", None, 3),
+    ("GET", "/v1/symptoms", None, 0),
+    ("POST", "/v1/diagnose", {"symptoms": ["G01", "G02", "G03", "G04"], "top_k": 5}, 2),
+    ("POST", "/v1/diagnose/batch", [{"symptoms": ["G01", "G02"]}, {"symptoms": ["G05", "G06"], "top_k": 10}], 2),
+    ("POST", "/v1/cases", {"disease_code": "P01", "symptom_weights": {"G01": 2, "G02": 1}, "solutions": ["T01", "T02"]}, 3),
+]
+
+
+def _queries(route: str) -> int:
+    return telemetry.registry.sql_queries.get(route, 0)
+
+
+def populate(client: TestClient) -> None:
+    """Añade casos sintéticos a la semilla para que las listas no sean triviales."""
+    body = "".join(json.dumps(d) + "\n" for d in CaseGenerator(0).case_dicts(300))
+    client.post("/v1/cases/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert len(case_base) > 100
+
+
+def measure(client: TestClient, method: str, path: str, payload) -> Tuple[int, int]:
+    """(status HTTP, consultas SQL) de una request con cachés calientes."""
+    client.request(method, path, json=payload)  # calienta refdata/case base
+    route = path.split("?")[0]
+    before = _queries(route)
+    r = client.request(method, path, json=payload)
+    return r.status_code, _queries(route) - before
+
+
+def main() -> int:
+    failed = 0
+    with TestClient(app) as client:
+        populate(client)
+        for method, path, payload, budget in BUDGETS:
+            status, used = measure(client, method, path, payload)
+            ok = status < 400 and used <= budget
+            failed += not ok
+            print(f"{'ok ' if ok else 'FAIL'} {method:<5} {path:<32} {used:>3} consultas (máx {budget}) HTTP {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
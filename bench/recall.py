@@ -0,0 +1,90 @@
+"""Recall@k y latencia del retrieve aproximado (app/ann.py) frente al exacto (app/matrix.py).
+
+    python -m bench.recall --sizes 100000,1000000 --grid 16x2,24x2,32x3 --candidates 500,2000
+
+El recall cuenta los empates: un resultado aproximado acierta si su score
+llega al k-ésimo score exacto, aunque el id no coincida con el del exacto.
+"""
+import argparse
+import time
+from typing import List
+
+from app import ann, matrix
+from app.casebase import Snapshot
+
+from .micro import percentiles
+from .synth import CaseGenerator
+
+_EPS = 1e-9
+
+
+def recall_at_k(exact: list, approx: list, k: int) -> float:
+    if not exact:
+        return 1.0
+    kth = exact[min(k, len(exact)) - 1][1]
+    hits = sum(1 for _, score, _ in approx[:k] if score >= kth - _EPS)
+    return min(hits, len(exact)) / min(k, len(exact))
+
+
+def run(sizes: List[int], grid: List[tuple], candidates: List[int], n_queries: int = 200,
+        top_k: int = 5, seed: int = 0) -> List[dict]:
+    gen = CaseGenerator(seed)
+    queries = gen.queries(n_queries)
+    rows = []
+    for n in sizes:
+        snap = Snapshot(1, tuple(gen.records(n)))
+        m = matrix.CaseMatrix(snap.version, snap.records)
+        exact, e_lat = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            exact.append(matrix.retrieve(m, q, top_k))
+            e_lat.append(time.perf_counter() - t0)
+        print(f"{n:>8} casos  exacto (matrix)       p50={percentiles(e_lat)['p50_ms']:.3f}ms "
+              f"p99={percentiles(e_lat)['p99_ms']:.3f}ms")
+
+        for bands, r in grid:
+            ix = ann.LSHIndex(bands, r)
+            t0 = time.perf_counter()
+            ix.reset(snap.records)
+            build_s = time.perf_counter() - t0
+            for max_c in candidates:
+                recalls, lat, n_cand = [], [], []
+                for q, ex in zip(queries, exact):
+                    t0 = time.perf_counter()
+                    res = ix.retrieve(snap, q, top_k, max_c, min_cases=0)
+                    lat.append(time.perf_counter() - t0)
+                    recalls.append(recall_at_k(ex, res, top_k))
+                    n_cand.append(len(ix.candidates(q, max_c)))
+                row = {
+                    "cases": n,
+                    "bands": bands,
+                    "rows": r,
+                    "max_candidates": max_c,
+                    "build_s": round(build_s, 2),
+                    "recall": round(sum(recalls) / len(recalls), 4),
+                    "mean_candidates": round(sum(n_cand) / len(n_cand), 1),
+                    "approx": percentiles(lat),
+                    "exact": percentiles(e_lat),
+                }
+                rows.append(row)
+                print(f"{n:>8} casos  {bands:>2}x{r} cand<={max_c:<6} recall@{top_k}={row['recall']:.3f} "
+                      f"cand={row['mean_candidates']:>7.1f}  p50={row['approx']['p50_ms']:.3f}ms "
+                      f"p99={row['approx']['p99_ms']:.3f}ms  build={build_s:.1f}s")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--grid", default=f"16x2,24x2,{ann.ANN_BANDS}x{ann.ANN_ROWS}", help="bandas x filas")
+    ap.add_argument("--candidates", default=f"{ann.ANN_MAX_CANDIDATES},2000")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    args = ap.parse_args(argv)
+    grid = [tuple(int(x) for x in g.split("x")) for g in args.grid.split(",")]
+    run([int(x) for x in args.sizes.split(",")], grid, [int(x) for x in args.candidates.split(",")],
+        args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
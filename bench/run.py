@@ -0,0 +1,102 @@
+"""Suite completa: micro-benchmarks + escenario end-to-end, con resultados en JSON.
+
+    python -m bench.run                                  # bench/results/<fecha>.json
+    python -m bench.run --sizes 1000,10000 --e2e-cases 5000 --compare bench/results/base.json
+    python -m bench.run --skip-e2e
+
+Cada archivo incluye commit, versiones y plataforma para poder comparar
+ejecuciones entre sí (--compare imprime la variación de q/s y p99 por fila).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy
+
+from . import e2e, micro
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _pct(new: float, old: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def compare(current: dict, base: dict) -> List[str]:
+    """Una línea por fila comparable de ambos resultados."""
+    lines = []
+    old_micro: Dict[tuple, dict] = {(r["cases"], r["engine"]): r for r in base.get("micro", [])}
+    for r in current.get("micro", []):
+        o = old_micro.get((r["cases"], r["engine"]))
+        if o:
+            lines.append(f"micro {r['cases']:>8} {r['engine']:<7} q/s {_pct(r['qps'], o['qps']):>8}  "
+                         f"p99 {_pct(r['retrieve']['p99_ms'], o['retrieve']['p99_ms']):>8}")
+    cur_e2e, old_e2e = current.get("e2e"), base.get("e2e")
+    if cur_e2e and old_e2e and cur_e2e["cases"] == old_e2e["cases"]:
+        old_levels = {r["concurrency"]: r for r in old_e2e["levels"]}
+        for r in cur_e2e["levels"]:
+            o = old_levels.get(r["concurrency"])
+            if o:
+                lines.append(f"e2e   c={r['concurrency']:<4} req/s {_pct(r['rps'], o['rps']):>8}  "
+                             f"p99 {_pct(r['p99_ms'], o['p99_ms']):>8}")
+    return lines
+
+
+def main(argv=None) -> Optional[int]:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--engines", default="python,matrix,index")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--max-python", type=int, default=100_000)
+    ap.add_argument("--e2e-cases", type=int, default=10_000)
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--duration", type=float, default=5.0)
+    ap.add_argument("--skip-e2e", action="store_true")
+    ap.add_argument("--output", help="ruta del JSON (por defecto bench/results/<fecha>.json)")
+    ap.add_argument("--compare", help="JSON de una ejecución anterior")
+    args = ap.parse_args(argv)
+
+    result = {"meta": metadata()}
+    result["micro"] = micro.run([int(x) for x in args.sizes.split(",")], args.engines.split(","),
+                                args.queries, max_python=args.max_python)
+    if not args.skip_e2e:
+        result["e2e"] = e2e.run(args.e2e_cases, [int(x) for x in args.concurrency.split(",")], args.duration)
+
+    path = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=2)
+    print(f"resultados en {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            base = json.load(fh)
+        print(f"comparado con {base['meta'].get('commit')} ({base['meta'].get('timestamp')}):")
+        for line in compare(result, base):
+            print("  " + line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Throughput de /v1/diagnose frente al número de cores, por backend de retrieve (app/executor.py).
+
+    python -m bench.scaling --cases 100000 --cores 1,2,4,8 --engine matrix
+    python -m bench.scaling --backends process --out scaling.json
+
+Por cada backend y número de cores c levanta un servidor y lo carga con 2*c
+clientes concurrentes (por debajo de RETRIEVE_QUEUE_MAX, para medir throughput
+y no rechazos):
+
+- inline:  `uvicorn --workers c`, el retrieve en el event loop de cada worker;
+- thread:  un worker con RETRIEVE_EXECUTOR=thread y c hilos;
+- process: un worker con RETRIEVE_EXECUTOR=process y c procesos sobre el
+  case base mapeado (CASEBASE_SNAPSHOT_PATH).
+
+La caché de resultados se desactiva para que cada request haga un retrieve.
+Con más cores que los de la máquina no hay nada que escalar: `cpus` va en el JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+from typing import List, Optional
+
+from . import loadtest
+from .e2e import prepare_database
+from .run import metadata
+from .synth import CaseGenerator
+
+BACKENDS = ("inline", "thread", "process")
+
+
+def _server(backend: str, cores: int, engine: str, snapshot_dir: str) -> tuple:
+    """(workers de uvicorn, entorno) para un backend con `cores` de paralelismo."""
+    env = {"CBR_ENGINE": engine, "RESULT_CACHE_SIZE": "0", "CASEBASE_REFRESH_SECONDS": "0"}
+    if backend == "inline":
+        return cores, env
+    env.update(RETRIEVE_EXECUTOR=backend, RETRIEVE_WORKERS=str(cores))
+    if backend == "process":
+        env["CASEBASE_SNAPSHOT_PATH"] = os.path.join(snapshot_dir, f"casebase-{cores}.bin")
+    return 1, env
+
+
+def run(n_cases: int, cores: List[int], backends: List[str], engine: str, duration: float,
+        seed: int = 0) -> List[dict]:
+    url = prepare_database(n_cases, seed)
+    queries = CaseGenerator(seed).queries(256)
+    snapshot_dir = tempfile.mkdtemp(prefix="psych-cbr-scaling-")
+    rows = []
+    for backend in backends:
+        base_rps: Optional[float] = None
+        for c in cores:
+            workers, env = _server(backend, c, engine, snapshot_dir)
+            with loadtest.local_server(workers=workers, env=env, database_url=url) as (base, _):
+                row = asyncio.run(loadtest.run_level(base, "diagnose", 2 * c, duration, queries))
+            base_rps = base_rps or row["rps"]
+            row.update(backend=backend, cores=c, engine=engine, cases=n_cases,
+                       speedup=round(row["rps"] / base_rps, 2) if base_rps else None)
+            rows.append(row)
+            print(f"{backend:<8} cores={c:<3} {row['rps']:>9.1f} req/s  x{row['speedup']:<5} "
+                  f"p50={row['p50_ms']:.1f}ms p99={row['p99_ms']:.1f}ms errors={row['errors']}")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", type=int, default=50_000)
+    ap.add_argument("--cores", default=",".join(str(c) for c in (1, 2, 4, 8) if c <= (os.cpu_count() or 1)) or "1")
+    ap.add_argument("--backends", default=",".join(BACKENDS))
+    ap.add_argument("--engine", default="matrix", help="CBR_ENGINE del servidor (python|matrix|index)")
+    ap.add_argument("--duration", type=float, default=5.0)
+    ap.add_argument("--out", help="guardar filas y metadatos en JSON")
+    args = ap.parse_args(argv)
+    rows = run(args.cases, [int(x) for x in args.cores.split(",")], args.backends.split(","),
+               args.engine, args.duration)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"metadata": metadata(), "rows": rows}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
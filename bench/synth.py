@@ -0,0 +1,93 @@
+"""Generador sintético y reproducible de case bases sobre los códigos de app/data.py.
+
+Cada enfermedad tiene un perfil fijo (por semilla) de síntomas nucleares y de
+soluciones preferidas. Un caso toma la mayoría de sus síntomas del perfil y
+algunos al azar. El número de síntomas sigue una distribución sesgada, con
+moda en 4-5, cola hasta 15 y al menos 1, y los pesos se concentran en 1-3.
+
+    python -m bench.synth 100000 > casos.jsonl     # para app.importer
+"""
+import json
+import random
+import sys
+from typing import Dict, Iterator, List
+
+from app.casebase import CaseRecord
+from app.data import DISEASES, SOLUTIONS, SYMPTOMS
+
+SYMPTOM_CODES = list(SYMPTOMS)
+DISEASE_CODES = list(DISEASES)
+SOLUTION_CODES = list(SOLUTIONS)
+WEIGHTS = [1.0, 2.0, 3.0, 5.0]
+WEIGHT_P = [0.4, 0.3, 0.2, 0.1]
+
+
+class CaseGenerator:
+    def __init__(self, seed: int = 0, core_share: float = 0.8):
+        self.seed = seed
+        self.core_share = core_share
+        profile_rng = random.Random(seed)
+        self.profiles: Dict[str, List[str]] = {
+            d: sorted(profile_rng.sample(SYMPTOM_CODES, profile_rng.randint(6, 12))) for d in DISEASE_CODES
+        }
+        self.treatments: Dict[str, List[str]] = {
+            d: profile_rng.sample(SOLUTION_CODES, 4) for d in DISEASE_CODES
+        }
+        # algunas enfermedades son mucho más frecuentes que otras
+        self.disease_p = [1.0 / (i + 1) for i in range(len(DISEASE_CODES))]
+
+    @staticmethod
+    def symptom_count(rng: random.Random) -> int:
+        return max(1, min(15, int(round(rng.lognormvariate(1.5, 0.45)))))
+
+    def _symptoms(self, rng: random.Random, disease: str) -> Dict[str, float]:
+        n = self.symptom_count(rng)
+        core = self.profiles[disease]
+        n_core = min(len(core), sum(rng.random() < self.core_share for _ in range(n)))
+        chosen = set(rng.sample(core, n_core))
+        while len(chosen) < n:
+            chosen.add(rng.choice(SYMPTOM_CODES))
+        return {c: rng.choices(WEIGHTS, WEIGHT_P)[0] for c in sorted(chosen)}
+
+    def case_dicts(self, n: int, seed_offset: int = 0) -> Iterator[dict]:
+        """Cuerpos de POST /v1/cases (JSONL del importador)."""
+        rng = random.Random(self.seed * 1_000_003 + seed_offset + 1)
+        for _ in range(n):
+            disease = rng.choices(DISEASE_CODES, self.disease_p)[0]
+            yield {
+                "disease_code": disease,
+                "symptom_weights": self._symptoms(rng, disease),
+                "solutions": sorted(rng.sample(self.treatments[disease], rng.randint(1, 3))),
+            }
+
+    def records(self, n: int) -> List[CaseRecord]:
+        """Casos en memoria, con ids 1..n, listos para cbr/matrix."""
+        return [
+            CaseRecord(i, d["disease_code"], DISEASES[d["disease_code"]], d["symptom_weights"], d["solutions"])
+            for i, d in enumerate(self.case_dicts(n), start=1)
+        ]
+
+    def queries(self, n: int, weighted: bool = False) -> List[Dict[str, float]]:
+        """Consultas del formulario: 3-8 síntomas, sesgadas hacia el perfil de una enfermedad."""
+        rng = random.Random(self.seed * 7919 + 17)
+        out = []
+        for _ in range(n):
+            disease = rng.choices(DISEASE_CODES, self.disease_p)[0]
+            sym = self._symptoms(rng, disease)
+            while len(sym) < 3:
+                sym.setdefault(rng.choice(SYMPTOM_CODES), 1.0)
+            codes = list(sym)[:8]
+            out.append({c: (sym[c] if weighted else 1.0) for c in codes})
+        return out
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else 1000
+    seed = int(argv[1]) if len(argv) > 1 else 0
+    for d in CaseGenerator(seed).case_dicts(n):
+        sys.stdout.write(json.dumps(d) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# el entorno de la app (SQLite temporal, semilla, auditoría en línea) se fija al importar
+# bench.querycount, y tiene que ser antes de que cualquier test importe app.db
+from bench import querycount  # noqa: F401
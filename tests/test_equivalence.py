@@ -0,0 +1,95 @@
+"""Los motores de retrieve (python, index, matrix y search_many) dan el mismo top-k sobre case bases aleatorios."""
+import random
+
+import pytest
+
+from app import cbr, matrix
+from app.casebase import CaseRecord, Snapshot
+from app.data import SYMPTOMS
+
+CODES = sorted(SYMPTOMS)
+SEEDS = range(6)
+
+
+def random_cases(rng: random.Random, n: int, negative: bool):
+    """Casos con pesos de 0 a 5 (y negativos si `negative`), ids crecientes como en un snapshot."""
+    low = -3.0 if negative else 0.0
+    cases = []
+    for i in range(n):
+        codes = rng.sample(CODES, rng.randint(1, 8))
+        weights = {c: round(rng.uniform(low, 5.0), 2) if rng.random() > 0.15 else 0.0 for c in codes}
+        cases.append(CaseRecord(10 * i + 1, f"D{i % 7}", f"Disease {i % 7}", weights))
+    return cases
+
+
+def random_queries(rng: random.Random, n_cases: int):
+    """Consultas de 1 a 8 síntomas; los top_k llegan a superar el número de casos con coincidencias."""
+    out = []
+    for _ in range(25):
+        query = rng.sample(CODES, rng.randint(1, 8))
+        if rng.random() < 0.5:
+            query = {c: round(rng.uniform(-1.0, 3.0), 2) for c in query}
+        out.append((query, rng.choice([1, 3, 10, n_cases // 2, n_cases, n_cases + 10])))
+    return out
+
+
+def summary(results):
+    return [(c.id, float(sim), det) for c, sim, det in results]
+
+
+@pytest.fixture(params=[(seed, negative) for seed in SEEDS for negative in (False, True)],
+                ids=lambda p: f"seed{p[0]}-{'neg' if p[1] else 'pos'}")
+def scenario(request):
+    seed, negative = request.param
+    rng = random.Random(seed)
+    cases = random_cases(rng, rng.randint(20, 120), negative)
+    # versión propia por escenario: matrix.for_snapshot cachea por versión
+    snap = Snapshot(10_000 + 2 * seed + negative, cases)
+    return snap, random_queries(rng, len(cases))
+
+
+def test_matrix_matches_python(scenario):
+    snap, queries = scenario
+    m = matrix.CaseMatrix(snap.version, snap.records)
+    for query, k in queries:
+        expected = summary(cbr.retrieve(snap.records, query)[:k])
+        assert summary(cbr.top(snap.records, query, k)) == expected
+        assert summary(matrix.retrieve(m, cbr._query_weights(query), k)) == expected
+
+
+def test_index_matches_python(scenario):
+    snap, queries = scenario
+    index = cbr.InvertedIndex()
+    index.reset(snap.records)
+    for query, k in queries:
+        expected = summary(cbr.retrieve(snap.records, query)[:k])
+        assert summary(index.retrieve(snap, cbr._query_weights(query), k)) == expected
+
+
+def test_index_follows_retain_and_deactivate(scenario):
+    snap, queries = scenario
+    half = len(snap.records) // 2
+    index = cbr.InvertedIndex()
+    index.reset(snap.records[:half])
+    for record in snap.records[half:]:
+        index.add(record)
+    gone = {c.id for c in snap.records[::3]}
+    for case_id in gone:
+        index.discard(case_id)
+    alive = Snapshot(snap.version, [c for c in snap.records if c.id not in gone])
+    for query, k in queries:
+        expected = summary(cbr.retrieve(alive.records, query)[:k])
+        assert summary(index.retrieve(alive, cbr._query_weights(query), k)) == expected
+
+
+@pytest.mark.parametrize("engine", ["python", "index", "matrix"])
+def test_search_many_matches_search(scenario, monkeypatch, engine):
+    snap, queries = scenario
+    monkeypatch.setattr(cbr, "ENGINE", engine)
+    # el índice global sigue al case base del proceso; aquí, uno sobre el snapshot del escenario
+    index = cbr.InvertedIndex()
+    index.reset(snap.records)
+    monkeypatch.setattr(cbr, "_ensure_index", lambda: index)
+    batch = cbr.search_many(snap, [q for q, _ in queries], [k for _, k in queries])
+    for (query, k), got in zip(queries, batch):
+        assert summary(got) == summary(cbr.retrieve(snap.records, query)[:k])
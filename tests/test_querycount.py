@@ -0,0 +1,22 @@
+"""Presupuesto de consultas SQL por endpoint (bench/querycount.py): un N+1 rompe el test."""
+import pytest
+from fastapi.testclient import TestClient
+
+# antes que app: fija DATABASE_URL (SQLite temporal), semilla y telemetría
+from bench import querycount
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(querycount.app) as c:
+        querycount.populate(c)
+        yield c
+
+
+@pytest.mark.parametrize(
+    "method,path,payload,budget", querycount.BUDGETS, ids=[f"{m} {p}" for m, p, _, _ in querycount.BUDGETS]
+)
+def test_query_budget(client, method, path, payload, budget):
+    status, used = querycount.measure(client, method, path, payload)
+    assert status < 400
+    assert used <= budget, f"{method} {path}: {used} consultas SQL (máx {budget})"
@@ -0,0 +1,43 @@
+"""Consultas en vivo con el case base mapeado: lo que publica otro worker llega a los suscriptores."""
+import asyncio
+
+from app.casebase import CaseRecord
+from app.mapped import MappedCaseBase
+from app.subscriptions import Subscription, SubscriptionRegistry
+
+
+def _case(case_id: int, weights: dict) -> CaseRecord:
+    return CaseRecord(case_id, "P01", "Depresión", weights, ["T01"])
+
+
+def test_retain_in_other_worker_reaches_subscribers(tmp_path):
+    path = str(tmp_path / "casebase.bin")
+    writer, reader = MappedCaseBase(path), MappedCaseBase(path)
+    writer.add_many([_case(1, {"G01": 1.0, "G02": 1.0}), _case(2, {"G03": 1.0})])
+
+    loop = asyncio.new_event_loop()
+    try:
+        registry = SubscriptionRegistry()
+        registry._attached = True
+        reader.attach(registry)
+        sub = Subscription({"G01": 1.0, "G02": 1.0}, top_k=2, loop=loop)
+        sub.ranking = [(reader.snapshot().records[0], 1.0)]
+        sub.stale = False
+        registry.register(sub)
+
+        # retain en el otro "worker" y discard de un caso del ranking
+        writer.add_many([_case(3, {"G01": 1.0})])
+        reader.snapshot()
+        loop.run_until_complete(asyncio.sleep(0))
+        delta = sub.queue.get_nowait()
+        assert delta["type"] == "delta"
+        assert delta["entered"]["case_id"] == 3
+        assert delta["rank"] == 2
+
+        writer.discard_many([1])
+        reader.snapshot()
+        loop.run_until_complete(asyncio.sleep(0))
+        assert sub.stale
+        assert sub.queue.get_nowait() is None
+    finally:
+        loop.close()